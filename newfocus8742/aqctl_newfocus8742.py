@@ -10,10 +10,16 @@ from artiq import tools
 
 def get_argparser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--tcp", help="use TCP device, else use first "
-                                      "USB device")
+    parser.add_argument("--tcp", help="use TCP device (host[:port]), else "
+                                      "use first USB device")
     parser.add_argument("--simulation", action="store_true",
                         help="simulation device")
+    parser.add_argument("--pipeline-depth", type=int, default=None,
+                        help="maximum number of queries in flight "
+                             "(default: transport specific)")
+    parser.add_argument("--no-schedule-moves", action="store_true",
+                        help="do not hold back moves while the axis is "
+                             "moving (see schedule_moves)")
 
     tools.simple_network_args(parser, 3257)
     tools.verbosity_args(parser)
@@ -33,10 +39,17 @@ def main():
         dev = loop.run_until_complete(NewFocus8742Sim.connect())
     elif args.tcp:
         from .tcp import NewFocus8742TCP
-        dev = loop.run_until_complete(NewFocus8742TCP.connect(args.tcp))
+        host, _, port = args.tcp.partition(":")
+        dev = loop.run_until_complete(NewFocus8742TCP.connect(
+            host, int(port) if port else 23))
+        dev.start_supervisor()
     else:
         from .usb import NewFocus8742USB
         dev = loop.run_until_complete(NewFocus8742USB.connect(args.usb))
+    if args.pipeline_depth is not None:
+        dev.pipeline_depth = args.pipeline_depth
+    # several clients may move the same axes
+    dev.schedule_moves = not args.no_schedule_moves
 
     try:
         simple_server_loop({"newfocus8742": dev},
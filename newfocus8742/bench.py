@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+
+from .motion import move_time
+from .farm import summarize
+
+
+logger = logging.getLogger(__name__)
+
+
+# Each scenario returns a dict of metrics. Metrics ending in "_per_s" are
+# better when higher, all others (durations in seconds) when lower.
+
+
+async def bench_query_latency(dev, n=200):
+    """Sequential single queries (``TE?``)."""
+    loop = asyncio.get_event_loop()
+    lat = []
+    for i in range(n):
+        t = loop.time()
+        await dev.error_code()
+        lat.append(loop.time() - t)
+    s = summarize(lat)
+    return {"p50": s["p50"], "p99": s["p99"]}
+
+
+def _lines_written(dev):
+    return sum(c["count"] for c in dev.get_stats()["commands"].values())
+
+
+async def bench_query_throughput(dev, n=1000):
+    """Concurrent pipelined queries (``TE?``, never coalesced) and batched
+    queries (``TP?``), and the lines written for them."""
+    loop = asyncio.get_event_loop()
+    lines = _lines_written(dev)
+    t = loop.time()
+    await asyncio.gather(*[dev.error_code() for i in range(n)])
+    t = loop.time() - t
+    pipelined = n/t
+    pipelined_lines = (_lines_written(dev) - lines)/t
+    cmds = [("TP?", 1 + i % 4) for i in range(12)]
+    lines = _lines_written(dev)
+    t = loop.time()
+    for i in range(n//len(cmds)):
+        await dev.ask_many(cmds)
+    t = loop.time() - t
+    batched = n//len(cmds)*len(cmds)/t
+    batched_lines = (_lines_written(dev) - lines)/t
+    return {"pipelined_per_s": pipelined,
+            "pipelined_lines_per_s": pipelined_lines,
+            "batched_per_s": batched,
+            "batched_lines_per_s": batched_lines}
+
+
+async def bench_finish_latency(dev, n=10, steps=100):
+    """Delay between the predicted end of a move and :meth:`finish`
+    returning."""
+    loop = asyncio.get_event_loop()
+    xx = 1
+    velocity = await dev.get_velocity(xx)
+    acceleration = await dev.get_acceleration(xx)
+    expected = move_time(steps, velocity, acceleration)
+    lat = []
+    for i in range(n):
+        t = loop.time()
+        dev.set_relative(xx, steps if i % 2 else -steps)
+        await dev.finish(xx)
+        lat.append(loop.time() - t - expected)
+    s = summarize(lat)
+    return {"p50": s["p50"], "p99": s["p99"], "move": expected}
+
+
+async def bench_dump(dev, n=20):
+    """Read all per-axis state (as ``test.py``'s ``dump()``)."""
+    cmds = [(cmd + "?", xx) for xx in range(1, 5)
+            for cmd in "AC DH MD PA PR QM TP VA".split()]
+    loop = asyncio.get_event_loop()
+    lat = []
+    for i in range(n):
+        t = loop.time()
+        await dev.ask_many(cmds)
+        lat.append(loop.time() - t)
+    return {"p50": summarize(lat)["p50"]}
+
+
+async def bench_rpc(dev, n=200):
+    """Single queries through the ARTIQ RPC server (as in
+    ``aqctl_newfocus8742``)."""
+    try:
+        from artiq.protocols.pc_rpc import Server, AsyncioClient
+    except ImportError:
+        return None
+    server = Server({"newfocus8742": dev})
+    await server.start("127.0.0.1", 0)
+    try:
+        port = server.server.sockets[0].getsockname()[1]
+        client = AsyncioClient()
+        await client.connect_rpc("127.0.0.1", port, "newfocus8742")
+        try:
+            loop = asyncio.get_event_loop()
+            lat = []
+            for i in range(n):
+                t = loop.time()
+                await client.error_code()
+                lat.append(loop.time() - t)
+        finally:
+            client.close_rpc()
+    finally:
+        await server.stop()
+    s = summarize(lat)
+    return {"p50": s["p50"], "p99": s["p99"]}
+
+
+scenarios = {
+    "query_latency": bench_query_latency,
+    "query_throughput": bench_query_throughput,
+    "finish_latency": bench_finish_latency,
+    "dump": bench_dump,
+    "rpc": bench_rpc,
+}
+
+
+async def connect(target):
+    """Connect to a benchmark target.
+
+    Args:
+        target (str): ``"sim"`` (in-process simulation), ``"simtcp"``
+            (simulation behind a local :class:`SimServer`),
+            ``"tcp:host[:port]"`` or ``"usb"``.
+
+    Returns:
+        tuple: ``(driver, cleanup coroutine function)``.
+    """
+    if target == "sim":
+        from .sim import NewFocus8742Sim
+        dev = await NewFocus8742Sim.connect()
+
+        async def cleanup():
+            pass
+    elif target == "simtcp":
+        from .simserver import SimServer
+        from .tcp import NewFocus8742TCP
+        server = SimServer()
+        port = await server.start()
+        dev = await NewFocus8742TCP.connect("127.0.0.1", port)
+
+        async def cleanup():
+            dev.close()
+            server.close()
+            await server.wait_closed()
+    elif target.startswith("tcp:"):
+        from .tcp import NewFocus8742TCP
+        host, _, port = target[4:].partition(":")
+        dev = await NewFocus8742TCP.connect(host, int(port) if port else 23)
+
+        async def cleanup():
+            dev.close()
+    elif target == "usb":
+        from .usb import NewFocus8742USB
+        dev = await NewFocus8742USB.connect()
+
+        async def cleanup():
+            dev.close()
+    else:
+        raise ValueError("unknown target {}".format(target))
+    return dev, cleanup
+
+
+async def run(target, names=None, repeat=3):
+    """Run benchmark scenarios against a target.
+
+    Each scenario is repeated and the median of each metric is reported.
+
+    Args:
+        target (str): See :func:`connect`.
+        names (list of str): Scenarios to run. All if None.
+        repeat (int): Repetitions per scenario.
+
+    Returns:
+        dict: Results with metrics by scenario.
+    """
+    if names is None:
+        names = list(scenarios)
+    dev, cleanup = await connect(target)
+    results = {}
+    try:
+        for name in names:
+            runs = []
+            for i in range(repeat):
+                r = await scenarios[name](dev)
+                if r is None:
+                    logger.warning("%s skipped", name)
+                    break
+                runs.append(r)
+            if runs:
+                results[name] = {k: statistics.median(r[k] for r in runs)
+                                 for k in runs[0]}
+    finally:
+        await cleanup()
+    return {
+        "target": target,
+        "time": time.time(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=.2):
+    """Compare benchmark results to a baseline.
+
+    Args:
+        report (dict): Results from :func:`run`.
+        baseline (dict): Earlier results from :func:`run`.
+        tolerance (float): Relative change tolerated before a metric is
+            flagged.
+
+    Returns:
+        list: ``(scenario, metric, baseline, value, relative change)`` for
+        each metric that got worse by more than `tolerance`.
+    """
+    regressions = []
+    for name, metrics in report["results"].items():
+        base = baseline["results"].get(name, {})
+        for k, v in metrics.items():
+            b = base.get(k)
+            if not b or v is None:
+                continue
+            change = (v - b)/abs(b)
+            if k.endswith("_per_s"):
+                change = -change
+            if change > tolerance:
+                regressions.append((name, k, b, v, change))
+    return regressions
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        description="New Focus 8742 driver benchmarks")
+    parser.add_argument("-t", "--target", default="sim",
+                        help="sim, simtcp, tcp:host[:port] or usb "
+                             "(default: %(default)s)")
+    parser.add_argument("-s", "--scenario", action="append",
+                        choices=sorted(scenarios),
+                        help="scenario to run, repeat for several "
+                             "(default: all)")
+    parser.add_argument("-r", "--repeat", default=3, type=int,
+                        help="repetitions per scenario "
+                             "(default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="write the JSON results to this file")
+    parser.add_argument("-c", "--compare",
+                        help="baseline JSON results to compare against")
+    parser.add_argument("--tolerance", default=.2, type=float,
+                        help="relative change flagged as regression "
+                             "(default: %(default)s)")
+    parser.add_argument("-v", "--verbose", default=0, action="count",
+                        help="increase logging level")
+    return parser
+
+
+def main():
+    args = get_argparser().parse_args()
+    logging.basicConfig(level=logging.WARNING - 10*args.verbose)
+
+    loop = asyncio.get_event_loop()
+    report = loop.run_until_complete(
+        run(args.target, args.scenario, args.repeat))
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, k, b, v, change in regressions:
+            print("REGRESSION {} {}: {:.4g} -> {:.4g} ({:+.0%})".format(
+                name, k, b, v, change), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
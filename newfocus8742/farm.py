@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import multiprocessing
+import random
+
+from .sim import NewFocus8742Sim
+from .simserver import SimServer
+from .tcp import NewFocus8742TCP
+
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(data, q):
+    """Return the `q`-th percentile (0-100) of sorted `data` (nearest
+    rank)."""
+    if not data:
+        return None
+    i = int(round(q/100*(len(data) - 1)))
+    return data[i]
+
+
+def summarize(data):
+    """Count, median, 99th percentile and maximum of `data`."""
+    data = sorted(data)
+    return {
+        "n": len(data),
+        "p50": percentile(data, 50),
+        "p99": percentile(data, 99),
+        "max": data[-1] if data else None,
+    }
+
+
+async def op_poll(dev, xx):
+    """Read the position."""
+    await dev.position(xx)
+
+
+async def op_move(dev, xx):
+    """Start a short relative move and read the motion status."""
+    dev.set_relative(xx, random.choice((-10, 10)))
+    await dev.done(xx)
+
+
+async def op_finish(dev, xx):
+    """Move and wait for the move to be done."""
+    dev.set_relative(xx, random.choice((-10, 10)))
+    await dev.finish(xx)
+
+
+ops = {
+    "poll": op_poll,
+    "move": op_move,
+    "finish": op_finish,
+}
+
+
+def parse_mix(mix):
+    """Parse a workload mix like ``"poll=8,move=1,finish=1"``.
+
+    Returns:
+        dict: Weight by operation.
+    """
+    ret = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ops:
+            raise ValueError("unknown operation {}".format(name))
+        ret[name] = float(weight) if weight else 1.
+    return ret
+
+
+class Farm:
+    """Many simulated controllers driven concurrently.
+
+    Each controller is a :class:`NewFocus8742Sim` behind its own
+    :class:`SimServer` port and is driven through a
+    :class:`NewFocus8742TCP` client (or, with ``transport="inproc"``,
+    directly through the simulation). The client tasks execute a random
+    mix of operations and record the latency of each. The event loop lag
+    is sampled alongside.
+
+    Args:
+        n (int): Number of controllers.
+        transport (str): ``"tcp"`` or ``"inproc"``.
+        latency (float): Simulated processing time per command.
+        jitter (float): Simulated random processing time per command.
+        ports (list of int): Connect to these (already running) simulation
+            servers instead of starting them in this process.
+    """
+    def __init__(self, n=10, transport="tcp", latency=0., jitter=0.,
+                 ports=None):
+        self.n = n
+        self.transport = transport
+        self.latency = latency
+        self.jitter = jitter
+        self.ports = ports
+        self.servers = []
+        self.devs = []
+
+    async def start(self):
+        if self.transport == "inproc":
+            self.devs = [NewFocus8742Sim() for i in range(self.n)]
+            return
+        ports = self.ports
+        if ports is None:
+            ports = []
+            for i in range(self.n):
+                server = SimServer(latency=self.latency, jitter=self.jitter)
+                ports.append(await server.start())
+                self.servers.append(server)
+        self.devs = [await NewFocus8742TCP.connect("127.0.0.1", port)
+                     for port in ports]
+
+    async def stop(self):
+        for dev in self.devs:
+            dev.close()
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def _drive(self, dev, mix, duration, latencies, errors):
+        loop = asyncio.get_event_loop()
+        names = list(mix)
+        cum = list(itertools.accumulate(mix[name] for name in names))
+        end = loop.time() + duration
+        while loop.time() < end:
+            op = ops[names[bisect.bisect(cum, random.uniform(0, cum[-1]))]]
+            t = loop.time()
+            try:
+                await op(dev, random.randint(1, 4))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.debug("operation failed", exc_info=True)
+                errors[0] += 1
+            else:
+                latencies.append(loop.time() - t)
+
+    async def _monitor(self, interval, lag):
+        loop = asyncio.get_event_loop()
+        t = loop.time()
+        while True:
+            await asyncio.sleep(interval)
+            now = loop.time()
+            lag.append(now - t - interval)
+            t = now
+
+    async def run(self, mix, duration=5., concurrency=1, lag_interval=.01):
+        """Drive all controllers.
+
+        Args:
+            mix (dict): Weight by operation name (``"poll"``, ``"move"``,
+                ``"finish"``).
+            duration (float): Run time in seconds.
+            concurrency (int): Client tasks per controller.
+            lag_interval (float): Event loop lag sampling interval.
+
+        Returns:
+            dict: Aggregate throughput and latency, per controller
+            latency and error count and event loop lag (seconds).
+        """
+        latencies = [[] for dev in self.devs]
+        errors = [[0] for dev in self.devs]
+        lag = []
+        monitor = asyncio.ensure_future(self._monitor(lag_interval, lag))
+        try:
+            await asyncio.gather(*[
+                self._drive(dev, mix, duration, latencies[i], errors[i])
+                for i, dev in enumerate(self.devs)
+                for j in range(concurrency)])
+        finally:
+            monitor.cancel()
+        total = sum(len(lat) for lat in latencies)
+        return {
+            "devices": len(self.devs),
+            "transport": self.transport,
+            "mix": mix,
+            "duration": duration,
+            "concurrency": concurrency,
+            "operations": total,
+            "throughput": total/duration,
+            "errors": sum(e[0] for e in errors),
+            "latency": summarize([t for lat in latencies for t in lat]),
+            "per_device": [dict(summarize(lat), errors=e[0])
+                           for lat, e in zip(latencies, errors)],
+            "loop_lag": summarize(lag),
+        }
+
+
+def _serve(n, latency, jitter, conn):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    servers = [SimServer(latency=latency, jitter=jitter) for i in range(n)]
+    conn.send([loop.run_until_complete(server.start())
+               for server in servers])
+    try:
+        loop.run_forever()
+    finally:
+        for server in servers:
+            server.close()
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        description="Drive many simulated New Focus 8742 controllers "
+                    "concurrently and report throughput and latency")
+    parser.add_argument("-n", "--devices", default=10, type=int,
+                        help="number of controllers (default: %(default)s)")
+    parser.add_argument("--transport", default="tcp",
+                        choices=("tcp", "inproc"),
+                        help="talk to the simulations over local TCP or "
+                             "in-process (default: %(default)s)")
+    parser.add_argument("--subprocess", action="store_true",
+                        help="run the TCP simulation servers in a separate "
+                             "process")
+    parser.add_argument("--mix", default="poll=8,move=1,finish=1",
+                        help="operation weights (default: %(default)s)")
+    parser.add_argument("-d", "--duration", default=5., type=float,
+                        help="run time in seconds (default: %(default)s)")
+    parser.add_argument("-c", "--concurrency", default=1, type=int,
+                        help="client tasks per controller "
+                             "(default: %(default)s)")
+    parser.add_argument("--latency", default=0., type=float,
+                        help="simulated processing time per command in "
+                             "seconds (default: %(default)s)")
+    parser.add_argument("--jitter", default=0., type=float,
+                        help="simulated random processing time per command "
+                             "in seconds (default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="write the JSON report to this file")
+    parser.add_argument("-v", "--verbose", default=0, action="count",
+                        help="increase logging level")
+    return parser
+
+
+def main():
+    args = get_argparser().parse_args()
+    logging.basicConfig(level=logging.WARNING - 10*args.verbose)
+
+    ports, proc = None, None
+    if args.subprocess and args.transport == "tcp":
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(
+            target=_serve, args=(args.devices, args.latency, args.jitter,
+                                 child), daemon=True)
+        proc.start()
+        ports = parent.recv()
+
+    loop = asyncio.get_event_loop()
+    farm = Farm(args.devices, args.transport, args.latency, args.jitter,
+                ports)
+    loop.run_until_complete(farm.start())
+    try:
+        report = loop.run_until_complete(farm.run(
+            parse_mix(args.mix), args.duration, args.concurrency))
+    finally:
+        loop.run_until_complete(farm.stop())
+        if proc is not None:
+            proc.terminate()
+    report = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+class FlowControl:
+    """Adaptive limit of the number of queries in flight.
+
+    Additive increase, multiplicative decrease on the measured round trip
+    times: the window grows while the round trip time of each kind of
+    query stays close to the lowest one seen (the controller keeps up) and
+    shrinks when it rises (responses queue up in the controller) or when
+    responses are lost or the controller reports overruns
+    (:meth:`congested`). Below the slow start threshold the window grows
+    by one per response, above it by one per window of responses.
+
+    Args:
+        window (float): Initial window.
+    """
+    minimum = 1
+    # round trip times above tolerance*base + slack indicate congestion
+    tolerance = 1.5
+    slack = 200e-6
+    # window after congestion as a fraction of the window before
+    decrease = .5
+    # speed at which the base round trip time follows larger values
+    drift = .01
+
+    def __init__(self, window=1.):
+        self.window = window
+        self.threshold = float("inf")
+        # lowest recent round trip time by kind of query
+        self.base = {}
+        # responses to wait for before the next decrease
+        self._recover = 0
+
+    def limit(self, maximum):
+        """Number of queries allowed in flight, at most `maximum`."""
+        return max(self.minimum, min(maximum, int(self.window)))
+
+    def sample(self, key, rtt, maximum):
+        """Update from a response.
+
+        Args:
+            key (str): Kind of query (e.g. ``"TP?"``).
+            rtt (float): Round trip time in seconds.
+            maximum (int): Upper limit of the window.
+        """
+        base = self.base.get(key)
+        if base is None or rtt < base:
+            base = rtt
+        else:
+            base += (rtt - base)*self.drift
+        self.base[key] = base
+        if self._recover:
+            self._recover -= 1
+        if rtt > self.tolerance*base + self.slack:
+            self.congested()
+        elif self.window < self.threshold:
+            self.window += 1
+        else:
+            self.window += 1/self.window
+        if self.window > maximum:
+            self.window = maximum
+
+    def congested(self):
+        """Shrink the window, at most once per window of responses."""
+        if self._recover:
+            return
+        # the responses to the queries already in flight are late, too
+        self._recover = int(self.window)
+        self.window = max(self.minimum, self.window*self.decrease)
+        self.threshold = self.window
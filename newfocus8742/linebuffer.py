@@ -0,0 +1,69 @@
+class LineBuffer:
+    """Reassemble lines from packets in a preallocated buffer.
+
+    Packets are copied once into a fixed `bytearray`. Complete lines are
+    located in place and decoded straight from a `memoryview` of the
+    buffer. Additional complete lines stay buffered for later
+    :meth:`readline` calls. The buffer is used circularly: it rewinds to
+    the start whenever it is empty and only the (short) tail of an
+    incomplete line is ever moved to the front to make room.
+
+    Args:
+        eol (bytes): Line terminator.
+        size (int): Capacity in bytes. Bounds the line length.
+    """
+    def __init__(self, eol=b"\r\n", size=1024):
+        self.eol = eol
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first unread byte
+        self._end = 0  # end of data
+        self._scan = 0  # no eol before this position
+
+    def __len__(self):
+        """Number of buffered bytes."""
+        return self._end - self._start
+
+    def clear(self):
+        """Discard all buffered data."""
+        self._start = self._end = self._scan = 0
+
+    def _compact(self):
+        n = self._end - self._start
+        self._view[:n] = self._view[self._start:self._end]
+        self._scan -= self._start
+        self._start, self._end = 0, n
+
+    def feed(self, data):
+        """Append data.
+
+        Args:
+            data (bytes-like): Received data, e.g. one or more USB packets.
+
+        Raises:
+            BufferError: If the incomplete line does not fit.
+        """
+        n = len(data)
+        if self._end + n > len(self._buf):
+            self._compact()
+            if n > len(self._buf) - self._end:
+                raise BufferError("line buffer overflow")
+        self._view[self._end:self._end + n] = data
+        self._end += n
+
+    def readline(self):
+        """Return the next complete line.
+
+        Returns:
+            str: Line without terminator or None if there is no complete
+            line buffered.
+        """
+        i = self._buf.find(self.eol, self._scan, self._end)
+        if i < 0:
+            self._scan = max(self._start, self._end - len(self.eol) + 1)
+            return None
+        line = str(self._view[self._start:i], "ascii")
+        self._start = self._scan = i + len(self.eol)
+        if self._start == self._end:
+            self.clear()
+        return line
@@ -0,0 +1,146 @@
+import time
+import math
+
+
+def move_time(steps, velocity, acceleration):
+    """Duration of a move with a trapezoidal velocity profile.
+
+    Args:
+        steps (int): Distance in steps, either sign.
+        velocity (float): Maximum velocity in steps/s.
+        acceleration (float): Acceleration and deceleration in steps/s².
+
+    Returns:
+        float: Duration in seconds.
+    """
+    steps = abs(steps)
+    if steps*acceleration < velocity**2:
+        # triangular profile: never reaches `velocity`
+        return 2*math.sqrt(steps/acceleration)
+    return steps/velocity + velocity/acceleration
+
+
+class MotionPredictor:
+    """Predict when the moves in progress will be done.
+
+    The velocity and acceleration settings and the moves are tracked from
+    the commands sent (:meth:`command`). The expected duration of each move
+    is scaled by a per-axis correction factor learned from the observed
+    completion times (:meth:`done`).
+
+    Args:
+        channels (int): Number of axes.
+        clock (callable): Monotonic time in seconds.
+    """
+    default_velocity = 2000
+    default_acceleration = 100000
+    # weight of a new observation in the correction factor
+    learning_rate = .2
+    # shorter moves are dominated by the polling delay, don't learn
+    learning_min = .02
+
+    def __init__(self, channels=4, clock=time.monotonic):
+        self.channels = channels
+        self.clock = clock
+        self.correction = [1. for i in range(channels)]
+        self.reset()
+
+    def reset(self):
+        """Forget the settings and moves, keep the correction factors."""
+        self.velocity = [self.default_velocity
+                         for i in range(self.channels)]
+        self.acceleration = [self.default_acceleration
+                             for i in range(self.channels)]
+        # commanded (target) position, None if unknown
+        self._target = [None for i in range(self.channels)]
+        # start time and expected duration of the move in progress
+        # (None if unknown)
+        self._start = [None for i in range(self.channels)]
+        self._duration = [None for i in range(self.channels)]
+
+    def _axes(self, xx):
+        if xx is None:
+            return range(self.channels)
+        return (xx - 1,)
+
+    def command(self, cmd, xx=None, *nn):
+        """Track a command sent to the controller.
+
+        Args:
+            cmd, xx, nn: See :meth:`NewFocus8742Protocol.fmt_cmd`.
+        """
+        if cmd in ("*RST", "*RCL"):
+            self.reset()
+            return
+        if xx is None or not 1 <= xx <= self.channels:
+            if cmd in ("AB", "ST"):
+                for i in range(self.channels):
+                    self._start[i] = None
+            return
+        i = xx - 1
+        if cmd == "VA" and nn:
+            self.velocity[i] = nn[0]
+        elif cmd == "AC" and nn:
+            self.acceleration[i] = nn[0]
+        elif cmd == "DH":
+            self._target[i] = nn[0] if nn else 0
+        elif cmd in ("AB", "ST"):
+            self._start[i] = None
+        elif cmd in ("PA", "PR", "MV") and not self.remaining(xx):
+            # the controller ignores moves while the axis is moving
+            if cmd == "MV" or not nn:
+                steps = None
+            elif cmd == "PR":
+                steps = nn[0]
+            elif self._target[i] is not None:
+                steps = nn[0] - self._target[i]
+            else:
+                steps = None
+            if cmd == "PA" and nn:
+                self._target[i] = nn[0]
+            elif cmd == "PR" and nn and self._target[i] is not None:
+                self._target[i] += nn[0]
+            self._start[i] = self.clock()
+            if steps is None:
+                self._duration[i] = None
+            else:
+                self._duration[i] = move_time(
+                    steps, self.velocity[i], self.acceleration[i])
+
+    def remaining(self, xx=None):
+        """Expected time until the moves on the axis are done.
+
+        Args:
+            xx (int): Motor channel. If None, all axes.
+
+        Returns:
+            float: Seconds, zero if unknown or already overdue.
+        """
+        now = self.clock()
+        t = 0.
+        for i in self._axes(xx):
+            if self._start[i] is None or self._duration[i] is None:
+                continue
+            t = max(t, self._start[i] + self._duration[i]*self.correction[i]
+                    - now)
+        return t
+
+    def done(self, xx=None):
+        """Record that the motion on the axis has been observed done.
+
+        Updates the correction factor from the observed duration.
+
+        Args:
+            xx (int): Motor channel. If None, all axes.
+        """
+        now = self.clock()
+        for i in self._axes(xx):
+            if self._start[i] is None:
+                continue
+            if (self._duration[i] is not None and
+                    self._duration[i] >= self.learning_min):
+                ratio = (now - self._start[i])/self._duration[i]
+                ratio = min(max(ratio, .5), 2.)
+                self.correction[i] += self.learning_rate*(
+                    ratio - self.correction[i])
+            self._start[i] = None
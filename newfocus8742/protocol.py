@@ -1,10 +1,47 @@
 import logging
 import asyncio
+import itertools
+import time
+from collections import deque
+
+from .motion import MotionPredictor
+from .telemetry import TelemetryBuffer
+from .stats import LinkStats
+from .trace import FlightRecorder
+from .flow import FlowControl
+from .scan import Scan
 
 logger = logging.getLogger(__name__)
 
+# commands defined by the protocol (e.g. "AC", "AC?", "*IDN?")
+_mnemonics = set()
+
+# response converters of the queries, by command
+_conv = {}
+
+# settings queries served from the cache, see `cache_settings`
+_settings = ("VA?", "AC?", "DH?", "QM?")
+
+# queries with side effects: reading an error removes it from the queue
+_volatile = ("TB?", "TE?")
+
+# commands sent ahead of everything else
+_stops = ("AB", "ST")
+# commands dropped from the queue by a stop
+_moves = ("PA", "PR", "MV")
+# commands held back while the axis is moving, see `schedule_moves`
+_scheduled = ("PA", "PR", "MV", "MC")
+
+
+def _current_task():
+    current_task = getattr(asyncio, "current_task", None)
+    if current_task is None:
+        current_task = asyncio.Task.current_task
+    return current_task()
+
 
 def _make_do(cmd, doc=None):
+    _mnemonics.add(cmd)
     def f(self, xx=None, *nn):
         self.do(cmd, xx, *nn)
     if doc is not None:
@@ -14,8 +51,10 @@ def _make_do(cmd, doc=None):
 
 def _make_ask(cmd, doc=None, conv=int):
     assert cmd.endswith("?")
-    async def f(self, xx=None, *nn):
-        ret = await self.ask(cmd, xx, *nn)
+    _mnemonics.add(cmd)
+    _conv[cmd] = conv
+    async def f(self, xx=None, *nn, max_age=None):
+        ret = await self.ask(cmd, xx, *nn, max_age=max_age)
         ret = conv(ret)
         return ret
     if doc is not None:
@@ -23,6 +62,23 @@ def _make_ask(cmd, doc=None, conv=int):
     return f
 
 
+class _Batch:
+    """Asynchronous context manager holding back the commands of a
+    driver, see :meth:`NewFocus8742Protocol.batch`."""
+    def __init__(self, dev):
+        self.dev = dev
+
+    async def __aenter__(self):
+        self.task = _current_task()
+        self.dev._corked.append(self.task)
+        return self.dev
+
+    async def __aexit__(self, *exc):
+        self.dev._corked.remove(self.task)
+        if not self.dev._corked:
+            self.dev._flush()
+
+
 class NewFocus8742Protocol:
     """New Focus/Newport 8742 Driver.
 
@@ -30,6 +86,81 @@ class NewFocus8742Protocol:
     https://www.newport.com/p/8742
     """
     poll_interval = .01
+    # polling backs off geometrically up to poll_interval_max
+    poll_backoff = 1.5
+    poll_interval_max = .1
+    # fraction of the predicted move time to sleep before polling
+    predict_fraction = .9
+    pipeline_depth = 1
+    # limit the queries in flight below pipeline_depth depending on the
+    # measured round trip times, see FlowControl
+    adaptive_depth = True
+    # error codes taken as a sign of commands garbled by an input overrun:
+    # COMMAND DOES NOT EXIST, COMMAND PARAMETER MISSING
+    overrun_errors = (6, 38)
+    sep = ";"
+    # seconds to wait for each response line, None waits indefinitely
+    timeout = None
+    # query and part of its response used to realign the responses to
+    # the queries, see resync()
+    sentinel = ("VE?", "8742")
+    # serve get_velocity(), get_acceleration(), get_home() and get_type()
+    # from a write-through cache
+    cache_settings = False
+    # reuse the response of an identical query completed at most this
+    # long ago (seconds)
+    coalesce_window = 0.
+    # hold back moves and motor checks until the axes are done moving
+    schedule_moves = False
+    channels = 4
+
+    def __init__(self):
+        # Outgoing traffic is scheduled by priority: stop and abort are
+        # written immediately, then the other commands, then the queries
+        # (subject to the pipeline depth).
+        # commands not yet written: (cmd, xx, line)
+        self._commands = deque()
+        # query lines not yet written:
+        # (line, number of responses, future, time queued)
+        self._queries = deque()
+        # queries written but not fully answered yet, in write order:
+        # [future, number of responses, responses, stats, time written,
+        #  sentinel response or None, line, timed out before]
+        self._inflight = deque()
+        self._pump = None
+        self._watchers = set()
+        self._motion = MotionPredictor()
+        # cached settings query responses by (cmd, xx)
+        self._settings = {}
+        # in-flight and recently completed queries by line
+        self._shared = {}
+        self._fresh = {}
+        self._telemetry = None
+        self._telemetry_task = None
+        # time the last command was sent
+        self._command_time = 0.
+        # number of commands sent
+        self._generation = 0
+        # hold back all traffic, e.g. while the connection is down
+        self._paused = False
+        # tasks in batch() contexts holding back commands, one per context
+        self._corked = []
+        # write the held back commands ahead of a query from a batch()
+        self._uncork = False
+        self._flow = FlowControl()
+        # axes with motion in progress
+        self._moving = set()
+        # axes with motion in progress or held back: future resolved
+        # once done
+        self._busy = {}
+        # motion commands held back by axis: deque of (sequence, cmd, nn)
+        self._held = {}
+        # held back motion commands of all axes: deque of (sequence, cmd, nn)
+        self._held_all = deque()
+        self._seq = itertools.count()
+        self._stats = LinkStats(self.sep)
+        # recent wire traffic, recorded by the transports
+        self._recorder = FlightRecorder()
 
     def fmt_cmd(self, cmd, xx=None, *nn):
         """Format a command.
@@ -45,33 +176,571 @@ class NewFocus8742Protocol:
             cmd += ", ".join("{:d}".format(n) for n in nn)
         return cmd
 
+    def _pack(self, cmds):
+        """Format commands and join them into as few lines as possible.
+
+        Args:
+            cmds (iterable): ``(cmd, xx, *nn)`` tuples, see :meth:`fmt_cmd`
+
+        Yields:
+            tuple: ``(line, number of queries in line)``
+        """
+        return self._join(self.fmt_cmd(*cmd) for cmd in cmds)
+
+    def _join(self, cmds):
+        """Join formatted commands into as few lines as possible.
+
+        Lines are joined with :attr:`sep` and are shorter than 64 bytes.
+
+        Args:
+            cmds (iterable of str): Formatted commands.
+
+        Yields:
+            tuple: ``(line, number of queries in line)``
+        """
+        line, n = None, 0
+        for cmd in cmds:
+            assert len(cmd) < 64
+            q = int(cmd.endswith("?"))
+            if line is not None and len(line) + len(self.sep) + len(cmd) < 64:
+                line += self.sep + cmd
+                n += q
+            else:
+                if line is not None:
+                    yield line, n
+                line, n = cmd, q
+        if line is not None:
+            yield line, n
+
     def do(self, cmd, xx=None, *nn):
         """Format and send a command to the device
 
+        Commands are sent ahead of queries that are waiting for room in
+        the pipeline. Stop (``ST``) and abort (``AB``) are written
+        immediately and drop the moves queued for the axis.
+
+        With :attr:`schedule_moves`, moves (``PA``, ``PR``, ``MV``) and
+        motor checks (``MC``) are held back while their axes are moving
+        (as reported by ``MD?`` after the predicted end of the move) and
+        written in order once they are done. The controller would ignore
+        them and report "MOTION IN PROGRESS". :meth:`finish` also waits
+        for the held back moves.
+
         See Also:
             :meth:`fmt_cmd`: for the formatting and additional
                 parameters.
+            :meth:`batch`: to join the commands of several calls.
         """
-        cmd = self.fmt_cmd(cmd, xx, *nn)
-        assert len(cmd) < 64
-        logger.debug("do %s", cmd)
-        self._writeline(cmd)
+        self._queue(cmd, xx, *nn)
+        if not self._corked:
+            self._flush()
 
-    async def ask(self, cmd, xx=None, *nn):
+    def do_many(self, cmds):
+        """Send several commands, joined into as few lines as possible.
+
+        Args:
+            cmds (iterable): ``(cmd, xx, *nn)`` tuples, see :meth:`do`.
+        """
+        for cmd in cmds:
+            assert not cmd[0].endswith("?"), "use ask_many() for queries"
+            self._queue(*cmd)
+        if not self._corked:
+            self._flush()
+
+    def batch(self):
+        """Hold back commands and join them into as few lines as possible.
+
+        Within the returned asynchronous context, commands (:meth:`do`)
+        are queued and written when the context exits, joined into lines
+        of at most 64 bytes. Queries from within the context still go out
+        right away, preceded by the commands queued before them. Queries
+        from other tasks do not write the held back commands. Stop and
+        abort are never held back. Contexts can be nested.
+
+        Example::
+
+            async with dev.batch():
+                for xx in range(1, 5):
+                    dev.set_velocity(xx, 2000)
+                    dev.set_acceleration(xx, 100000)
+
+        Returns:
+            Asynchronous context manager.
+        """
+        return _Batch(self)
+
+    async def batch_call(self, calls):
+        """Call several methods within one :meth:`batch`.
+
+        This is for clients of the RPC server (``aqctl_newfocus8742``) to
+        execute several calls in one round trip and have their commands
+        joined.
+
+        Args:
+            calls (list): ``(method name, args)`` tuples, e.g.
+                ``[("set_velocity", (1, 2000)), ("get_velocity", (1,))]``.
+                Calls are executed in order.
+
+        Returns:
+            list: The return values of the calls.
+        """
+        ret = []
+        async with self.batch():
+            for name, args in calls:
+                if name.startswith("_"):
+                    raise AttributeError(name)
+                r = getattr(self, name)(*args)
+                if asyncio.iscoroutine(r):
+                    r = await r
+                ret.append(r)
+        return ret
+
+    def _queue(self, cmd, xx=None, *nn):
+        if self.schedule_moves:
+            if cmd in _scheduled and self._hold(cmd, xx, nn):
+                return
+            if cmd in _stops:
+                self._drop_held(xx)
+        self._enqueue(cmd, xx, *nn)
+
+    def _enqueue(self, cmd, xx=None, *nn):
+        self._track(cmd, xx, *nn)
+        line = self.fmt_cmd(cmd, xx, *nn)
+        assert len(line) < 64
+        if cmd in _stops:
+            self._stop(cmd, xx, line)
+        else:
+            self._commands.append((cmd, xx, line))
+
+    def _stop(self, cmd, xx, line):
+        """Drop the queued moves for the axis and write the stop command
+        right away."""
+        if self._commands:
+            self._commands = deque(c for c in self._commands
+                                   if c[0] not in _moves or
+                                   (xx is not None and c[1] != xx))
+        if self._paused:
+            self._commands.appendleft((cmd, xx, line))
+            return
+        logger.debug("do %s", line)
+        self._stats.sent(line)
+        self._writeline(line)
+
+    async def ask(self, cmd, xx=None, *nn, max_age=None):
         """Execute a command and return a response.
 
         The command needs to include the final question mark.
 
+        Queries are pipelined: up to :attr:`pipeline_depth` queries are
+        written back to back before their responses arrive (fewer with
+        :attr:`adaptive_depth` while the controller falls behind). Responses are
+        matched to the queries in the order they were written. Concurrent
+        callers are safe. Callers can be cancelled: the responses to their
+        queries are discarded. See :attr:`timeout` and :meth:`resync` for
+        responses that do not arrive.
+
+        Args:
+            max_age (float): If the telemetry poller is running (see
+                :meth:`start_telemetry`), answer ``TP?`` and ``MD?`` from
+                the latest snapshot if it is at most this old (seconds) and
+                was taken after the last command.
+
         See Also:
             :meth:`fmt_cmd`: for the formatting and additional
                 parameters.
         """
         assert cmd.endswith("?")
-        self.do(cmd, xx, *nn)
-        ret = await self._readline()
+        if max_age is not None and not nn:
+            ret = self._sampled(cmd, xx, max_age)
+            if ret is not None:
+                return ret
+        key = (cmd, xx)
+        if self.cache_settings and not nn and key in self._settings:
+            return self._settings[key]
+        line = self.fmt_cmd(cmd, xx, *nn)
+        assert len(line) < 64
+        if cmd in _volatile:
+            ret, = await self._request(line)
+        else:
+            ret, = await self._request_shared(line)
+        logger.debug("ret %s", ret)
+        if cmd == "TE?":
+            self._check_error(ret)
+        if not nn:
+            self._read_back(cmd, xx, ret)
+        return ret
+
+    async def ask_many(self, cmds):
+        """Execute several commands and return the responses to the queries.
+
+        The commands are joined into as few lines as possible (see
+        :meth:`do_many`). The responses are converted like those of the
+        corresponding query methods (e.g. ``TP?`` to `int`, ``*IDN?`` to
+        `str`). Unknown queries return the response string.
+
+        Args:
+            cmds (iterable): ``(cmd, xx, *nn)`` tuples, see :meth:`ask`.
+                Commands other than queries are allowed as well, except
+                for moves, motor checks, stop and abort with
+                :attr:`schedule_moves`: they would bypass the scheduler.
+                Use :meth:`do` or :meth:`do_many` for those.
+
+        Returns:
+            list: Converted responses, one for each query in `cmds`.
+        """
+        cmds = list(cmds)
+        for cmd in cmds:
+            if self.schedule_moves and (
+                    cmd[0] in _scheduled or cmd[0] in _stops):
+                raise ValueError("{} bypasses the move scheduler, "
+                                 "use do()".format(cmd[0]))
+        for cmd in cmds:
+            if not cmd[0].endswith("?"):
+                self._track(*cmd)
+        futs = []
+        for line, n in self._pack(cmds):
+            fut = self._request(line, n)
+            if n:
+                futs.append(fut)
+        ret = []
+        for r in await asyncio.gather(*futs):
+            ret.extend(r)
         logger.debug("ret %s", ret)
+        cmds = [cmd for cmd in cmds if cmd[0].endswith("?")]
+        for cmd, r in zip(cmds, ret):
+            if cmd[0] == "TE?":
+                self._check_error(r)
+            elif len(cmd) == 2:
+                self._read_back(cmd[0], cmd[1], r)
+        return [_conv.get(cmd[0], str)(r) for cmd, r in zip(cmds, ret)]
+
+    def _track(self, cmd, xx=None, *nn):
+        """Update the motion prediction and the settings cache from a
+        command that is being sent."""
+        self._motion.command(cmd, xx, *nn)
+        self._command_time = time.time()
+        self._generation += 1
+        # queries after a command must not get responses from before
+        self._shared.clear()
+        self._fresh.clear()
+        if not self.cache_settings:
+            return
+        if cmd in ("*RCL", "*RST", "MC"):
+            self._settings.clear()
+        elif cmd in ("VA", "AC", "QM") and nn:
+            self._settings[(cmd + "?", xx)] = str(nn[0])
+        elif cmd == "DH":
+            self._settings[("DH?", xx)] = str(nn[0] if nn else 0)
+        elif cmd in ("PA", "PR", "MV"):
+            # auto motor detection may change the motor type during moves
+            self._settings.pop(("QM?", xx), None)
+
+    def _read_back(self, cmd, xx, ret):
+        """Update the motion prediction and the settings cache from the
+        response to a settings query."""
+        if cmd in ("VA?", "AC?"):
+            self._motion.command(cmd[:-1], xx, int(ret))
+        if self.cache_settings and cmd in _settings:
+            self._settings[(cmd, xx)] = ret
+
+    async def load_settings(self, axes=(1, 2, 3, 4)):
+        """Read the settings of the axes into the cache.
+
+        All settings are read in one exchange (see :meth:`ask_many`) and
+        this enables :attr:`cache_settings`. The cache is updated by the
+        corresponding `set_*` methods and cleared by :meth:`recall`,
+        :meth:`reset` and :meth:`check_motor`. The motor type is re-read
+        after moves since auto motor detection may change it.
+        """
+        self.cache_settings = True
+        self._settings.clear()
+        await self.ask_many([(cmd, xx) for xx in axes for cmd in _settings])
+
+    def clear_settings(self):
+        """Clear the settings cache."""
+        self._settings.clear()
+
+    def _request(self, line, n=1):
+        """Queue a line that elicits `n` responses.
+
+        Multiple responses to a line are expected either on separate lines
+        or on one line, separated by :attr:`sep`.
+
+        Returns:
+            asyncio.Future: Resolves to the list of response strings. None
+            if `n` is zero.
+        """
+        fut = None
+        if n:
+            fut = asyncio.get_event_loop().create_future()
+        if self._corked and _current_task() in self._corked:
+            # the commands of the batch go ahead of its own queries only
+            self._uncork = True
+        self._queries.append((line, n, fut, time.monotonic()))
+        self._flush()
+        return fut
+
+    def _request_shared(self, line):
+        """Queue a query unless an identical one is in flight or has
+        completed within :attr:`coalesce_window`.
+
+        Returns:
+            awaitable: Resolves to the list of response strings.
+        """
+        if self._commands and self._corked and \
+                _current_task() in self._corked:
+            # others could share it ahead of the held back commands
+            return self._request(line)
+        fut = self._shared.get(line)
+        if fut is None:
+            fresh = self._fresh.get(line)
+            if fresh is not None:
+                t, ret = fresh
+                if (asyncio.get_event_loop().time() - t <=
+                        self.coalesce_window):
+                    fut = asyncio.get_event_loop().create_future()
+                    fut.set_result(ret)
+                    return fut
+            fut = self._request(line)
+            self._shared[line] = fut
+            generation = self._generation
+            fut.add_done_callback(
+                lambda fut: self._shared_done(line, fut, generation))
+        # cancellation of one caller must not cancel the others
+        return asyncio.shield(fut)
+
+    def _shared_done(self, line, fut, generation):
+        if self._shared.get(line) is fut:
+            del self._shared[line]
+        # a response to a query sent before a command is not fresh
+        # for the queries after it
+        if self.coalesce_window and generation == self._generation and \
+                not fut.cancelled() and fut.exception() is None:
+            self._fresh[line] = asyncio.get_event_loop().time(), fut.result()
+
+    def _flush(self):
+        """Write the queued commands and then the queued queries while
+        the pipeline has room."""
+        if self._paused:
+            return
+        depth = self.pipeline_depth
+        if self.adaptive_depth:
+            depth = self._flow.limit(depth)
+        if self._commands and (not self._corked or self._uncork):
+            self._uncork = False
+            cmds, self._commands = self._commands, deque()
+            for line, n in self._join(c[2] for c in cmds):
+                logger.debug("do %s", line)
+                self._stats.sent(line)
+                self._writeline(line)
+        while self._queries:
+            line, n, fut, t = self._queries[0]
+            if n and len(self._inflight) >= depth:
+                break
+            self._queries.popleft()
+            if fut is not None and fut.done():  # cancelled before it was sent
+                continue
+            logger.debug("ask %s", line)
+            now = time.monotonic()
+            stats = self._stats.sent(line, now - t, len(self._inflight))
+            try:
+                self._writeline(line)
+            except Exception as e:
+                stats.errors += 1
+                if fut is None:
+                    logger.warning("write failed: %s", line, exc_info=True)
+                else:
+                    fut.set_exception(e)
+                continue
+            if n:
+                self._inflight.append([fut, n, [], stats, now, None, line,
+                                       False])
+        if self._inflight and self._pump is None:
+            self._pump = asyncio.ensure_future(self._read_responses())
+
+    async def _read_responses(self):
+        """Read response lines and hand them to the in-flight queries.
+
+        A query whose response does not arrive within :attr:`timeout`
+        fails with `asyncio.TimeoutError` but stays in flight to consume
+        its late response. If that does not arrive within another
+        :attr:`timeout` either, the response is considered lost and the
+        stream is resynchronized (see :meth:`resync`).
+        """
+        try:
+            while self._inflight:
+                try:
+                    if self.timeout is None:
+                        ret = await self._readline()
+                    else:
+                        ret = await asyncio.wait_for(self._readline(),
+                                                     self.timeout)
+                except asyncio.CancelledError:
+                    raise
+                except asyncio.TimeoutError:
+                    if not self._inflight:  # abandoned meanwhile
+                        continue
+                    entry = self._inflight[0]
+                    fut, n, rets, stats, t, sentinel, line, late = entry
+                    stats.errors += 1
+                    # The callers get new exceptions or exceptions without
+                    # traceback: the caught ones reference the frames of
+                    # this task and the callers may clear them.
+                    if sentinel is not None:
+                        self._inflight.popleft()
+                        if not fut.done():
+                            fut.set_exception(asyncio.TimeoutError())
+                    elif late:
+                        self._dump_trace("response lost, resynchronizing")
+                        self._resync()
+                    else:
+                        # the caller may be gone (cancelled) already
+                        logger.warning("response timed out")
+                        self._flow.congested()
+                        entry[7] = True
+                        if not fut.done():
+                            fut.set_exception(asyncio.TimeoutError())
+                except Exception as e:
+                    if self._paused:
+                        # reconnecting, the queries in flight are requeued
+                        break
+                    if not self._inflight:
+                        continue
+                    logger.warning("reading the response failed",
+                                   exc_info=True)
+                    fut, n, rets, stats = self._inflight.popleft()[:4]
+                    stats.errors += 1
+                    if not fut.done():
+                        fut.set_exception(e.with_traceback(None))
+                else:
+                    fut, n, rets, stats, t, sentinel, line = \
+                        self._inflight[0][:7]
+                    stats.bytes_received += len(ret)
+                    if sentinel is not None and sentinel not in ret:
+                        logger.warning("discarding response %r", ret)
+                    else:
+                        if n - len(rets) > 1:
+                            rets.extend(ret.split(self.sep,
+                                                  n - len(rets) - 1))
+                        else:
+                            rets.append(ret)
+                        if len(rets) >= n:
+                            self._inflight.popleft()
+                            t = time.monotonic() - t
+                            stats.wire.add(t)
+                            if self.adaptive_depth and sentinel is None:
+                                self._flow.sample(self._stats.key(line), t,
+                                                  self.pipeline_depth)
+                            # a cancelled or timed out caller still
+                            # consumes its responses
+                            if not fut.done():
+                                fut.set_result(rets)
+                try:
+                    self._flush()
+                except Exception:
+                    logger.warning("write failed", exc_info=True)
+        finally:
+            self._pump = None
+
+    def _requeue(self):
+        """Queue the unanswered queries in flight again, ahead of the
+        others, e.g. to write them again after reconnecting."""
+        while self._inflight:
+            fut, n, rets, stats, t, sentinel, line = self._inflight.pop()[:7]
+            if fut.done():
+                continue
+            if rets or sentinel is not None:
+                fut.set_exception(ConnectionError("connection lost"))
+                continue
+            self._queries.appendleft((line, n, fut, time.monotonic()))
+
+    def _check_error(self, code):
+        if int(code) in self.overrun_errors:
+            logger.warning("error %s, reducing the pipeline depth", code)
+            self._flow.congested()
+
+    def _resync(self):
+        """Abandon the queries in flight and write the sentinel query.
+
+        Returns:
+            asyncio.Future: Resolves once the sentinel has been answered.
+        """
+        for fut in (entry[0] for entry in self._inflight):
+            if not fut.done():
+                fut.set_exception(asyncio.TimeoutError())
+        self._inflight.clear()
+        cmd, response = self.sentinel
+        fut = asyncio.get_event_loop().create_future()
+        logger.debug("ask %s", cmd)
+        stats = self._stats.sent(cmd)
+        self._writeline(cmd)
+        self._inflight.append([fut, 1, [], stats, time.monotonic(),
+                               response, cmd, False])
+        return fut
+
+    async def resync(self):
+        """Realign the responses to the queries.
+
+        The queries in flight fail with `asyncio.TimeoutError` and their
+        responses are discarded. The :attr:`sentinel` query is written and
+        all responses are discarded until the sentinel response arrives.
+        The connection stays open. This is done automatically when a
+        response is lost (see :attr:`timeout`).
+        """
+        fut = self._resync()
+        self._flush()
+        await fut
+
+    def get_stats(self):
+        """Return the traffic statistics.
+
+        For each kind of line (by command mnemonics, e.g. ``"TP?"``,
+        ``"TP?;MD?"`` or ``"TP?*12"`` for joined commands, see
+        :class:`newfocus8742.stats.LinkStats`) the number of lines written,
+        the bytes sent and received, the number of failed exchanges and
+        histograms of the time spent waiting for room in the pipeline
+        (``wait``) and of the round trip time from writing the line to
+        its last response (``wire``). Commands other than queries have
+        neither. ``depth`` counts the number of queries that were already
+        in flight when a query was written. ``blocked`` is the histogram
+        of the time spent waiting for the transport to drain (if
+        supported). ``queued`` and ``inflight`` are the current numbers
+        of lines not yet written and of queries not yet answered,
+        ``window`` is the current adaptive limit of the latter (see
+        :attr:`adaptive_depth`).
+
+        Returns:
+            dict: Counters since :meth:`reset_stats`, see
+            :class:`newfocus8742.stats.LinkStats`.
+        """
+        ret = self._stats.as_dict()
+        ret["queued"] = len(self._commands) + len(self._queries)
+        ret["inflight"] = len(self._inflight)
+        ret["window"] = self._flow.window
         return ret
 
+    def reset_stats(self):
+        """Clear the traffic statistics."""
+        self._stats.reset()
+
+    def get_trace(self):
+        """Return the recent wire traffic.
+
+        The transports keep the last lines written and the last data read
+        in a ring buffer (see :class:`newfocus8742.trace.FlightRecorder`).
+
+        Returns:
+            list: ``(t, direction, data)`` tuples, oldest first. ``t`` is
+            `time.monotonic()`, ``direction`` is ``">"`` for written and
+            ``"<"`` for read data, ``data`` are the raw bytes.
+        """
+        return [(t, direction.decode(), data)
+                for t, direction, data in self._recorder.records()]
+
+    def _dump_trace(self, reason):
+        logger.error("%s, recent traffic:\n%s", reason,
+                     self._recorder.format())
+
     def _writeline(self, cmd):
         raise NotImplemented
 
@@ -302,9 +971,332 @@ class NewFocus8742Protocol:
             error buffer is cleared by one(1) element. This means that an error
             can be read only once, with either command.""")
 
+    async def _sleep(self, t):
+        """Sleep for `t` seconds of device time."""
+        await asyncio.sleep(t)
+
+    async def _sleep_predicted(self, xx=None):
+        """Sleep for most of the predicted remaining motion time."""
+        t = self._motion.remaining(xx)*self.predict_fraction
+        if t > 0:
+            await self._sleep(t)
+
+    def _axes_of(self, xx):
+        if xx is None:
+            return range(1, self.channels + 1)
+        return (xx,)
+
+    def _hold(self, cmd, xx, nn):
+        """Hold back a motion command if its axes are moving or have
+        earlier commands held back, else mark them as moving.
+
+        Returns:
+            bool: Whether the command has been held back.
+        """
+        axes = self._axes_of(xx)
+        if xx is None:
+            hold = self._moving or self._held or self._held_all
+        else:
+            hold = xx in self._moving or xx in self._held or self._held_all
+        loop = asyncio.get_event_loop()
+        for a in axes:
+            if a not in self._busy:
+                self._busy[a] = loop.create_future()
+        if not hold:
+            self._start_motion(axes)
+            return False
+        entry = (next(self._seq), cmd, nn)
+        if xx is None:
+            self._held_all.append(entry)
+        else:
+            self._held.setdefault(xx, deque()).append(entry)
+        return True
+
+    def _start_motion(self, axes):
+        for xx in axes:
+            if xx not in self._moving:
+                self._moving.add(xx)
+                task = asyncio.ensure_future(self._watch_motion(xx))
+                self._watchers.add(task)
+                task.add_done_callback(self._watchers.discard)
+
+    async def _watch_motion(self, xx):
+        try:
+            await self._wait_done(xx)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("motion status of axis %s failed", xx,
+                           exc_info=True)
+            self._held.pop(xx, None)
+            # fail finish() instead of reporting the axis as done
+            fut = self._busy.pop(xx, None)
+            if fut is not None and not fut.done():
+                fut.set_exception(e)
+                # re-raised by finish() and watch_done() if awaited, logged
+                # above otherwise
+                fut.exception()
+        finally:
+            self._moving.discard(xx)
+        self._release()
+
+    def _drop_held(self, xx):
+        """Drop the motion commands held back for the axis (all if
+        None)."""
+        if xx is None:
+            self._held.clear()
+            self._held_all.clear()
+        else:
+            self._held.pop(xx, None)
+        self._release()
+
+    def _release(self):
+        """Write the held back motion commands whose axes are done, in
+        order, and resolve the futures of the axes that are idle."""
+        first = self._held_all[0][0] if self._held_all else None
+        for xx, held in list(self._held.items()):
+            seq, cmd, nn = held[0]
+            if xx in self._moving or (first is not None and first < seq):
+                continue
+            held.popleft()
+            if not held:
+                del self._held[xx]
+            self._start_motion((xx,))
+            self._dispatch(cmd, xx, nn)
+        if self._held_all and not self._moving and all(
+                held[0][0] > first for held in self._held.values()):
+            seq, cmd, nn = self._held_all.popleft()
+            self._start_motion(self._axes_of(None))
+            self._dispatch(cmd, None, nn)
+        for xx, fut in list(self._busy.items()):
+            if xx not in self._moving and xx not in self._held and \
+                    not self._held_all:
+                del self._busy[xx]
+                if not fut.done():
+                    fut.set_result(None)
+
+    def _dispatch(self, cmd, xx, nn):
+        self._enqueue(cmd, xx, *nn)
+        if not self._corked:
+            self._flush()
+
     async def finish(self, xx=None):
+        """Wait until the motion on the axis is done.
+
+        The duration of moves started with :meth:`set_relative` or
+        :meth:`set_position` is predicted from the velocity and acceleration
+        settings. Polling starts once most of the predicted time has
+        passed and then backs off from :attr:`poll_interval` to
+        :attr:`poll_interval_max`.
+
+        With :attr:`schedule_moves`, this waits for the moves held back
+        for the axis as well.
+        """
+        if xx is not None and xx in self._busy:
+            await asyncio.shield(self._busy[xx])
+            return
+        await self._wait_done(xx)
+
+    async def _wait_done(self, xx=None):
+        await self._sleep_predicted(xx)
+        interval = self.poll_interval
         while not await self.done(xx):
-            await asyncio.sleep(self.poll_interval)
+            await self._sleep(interval)
+            interval = min(interval*self.poll_backoff, self.poll_interval_max)
+        self._motion.done(xx)
+
+    def watch_done(self, axes=(1, 2, 3, 4)):
+        """Poll the motion done status of several axes.
+
+        Every :attr:`poll_interval` the axes that are still moving are
+        queried together in one line (see :meth:`ask_many`). Polling stops
+        once all axes are done or all futures have been cancelled.
+
+        Args:
+            axes (iterable of int): Motor channels.
+
+        Returns:
+            dict: An `asyncio.Future` for each axis, resolving to the axis
+            once its motion is done.
+        """
+        loop = asyncio.get_event_loop()
+        futs = {xx: loop.create_future() for xx in axes}
+
+        def chain(xx):
+            # the motion scheduler already watches the axis
+            fut = futs[xx]
+
+            def done(busy):
+                if fut.done():
+                    return
+                if busy.exception() is not None:
+                    fut.set_exception(busy.exception())
+                else:
+                    fut.set_result(xx)
+            self._busy[xx].add_done_callback(done)
+
+        async def poll():
+            interval = self.poll_interval
+            try:
+                chained = set()
+                while True:
+                    for xx in futs:
+                        if xx in self._busy and xx not in chained:
+                            chain(xx)
+                            chained.add(xx)
+                    axes = [xx for xx, fut in futs.items()
+                            if not fut.done() and xx not in chained]
+                    if not axes:
+                        break
+                    t = min(self._motion.remaining(xx) for xx in axes)
+                    if t > 0:
+                        await self._sleep(t*self.predict_fraction)
+                    done = await self.ask_many([("MD?", xx) for xx in axes])
+                    for xx, d in zip(axes, done):
+                        if d:
+                            self._motion.done(xx)
+                            if not futs[xx].done():
+                                futs[xx].set_result(xx)
+                    if not all(done):
+                        await self._sleep(interval)
+                        interval = min(interval*self.poll_backoff,
+                                       self.poll_interval_max)
+            except Exception as e:
+                for fut in futs.values():
+                    if not fut.done():
+                        fut.set_exception(e)
+            finally:
+                self._watchers.discard(task)
+
+        task = asyncio.ensure_future(poll())
+        self._watchers.add(task)
+        return futs
+
+    async def finish_all(self, axes=(1, 2, 3, 4)):
+        """Wait until the motion on all given axes is done.
+
+        See Also:
+            :meth:`watch_done`
+        """
+        futs = self.watch_done(axes)
+        try:
+            await asyncio.gather(*futs.values())
+        finally:
+            for fut in futs.values():
+                fut.cancel()
+
+    async def wait_any(self, axes=(1, 2, 3, 4)):
+        """Wait until the motion on at least one of the given axes is done.
+
+        See Also:
+            :meth:`watch_done`
+
+        Returns:
+            list: The axes that are done.
+        """
+        futs = self.watch_done(axes)
+        try:
+            done, pending = await asyncio.wait(
+                futs.values(), return_when=asyncio.FIRST_COMPLETED)
+            return sorted(fut.result() for fut in done)
+        finally:
+            for fut in futs.values():
+                fut.cancel()
+
+    def scan(self, points, measure=None, relative=False, buffer=16):
+        """Move through a sequence of points and measure at each.
+
+        See :class:`newfocus8742.scan.Scan` for the arguments.
+
+        Returns:
+            Scan: Asynchronous iterator of ``(point, measurement)`` and
+            asynchronous context stopping it.
+        """
+        return Scan(self, points, measure, relative, buffer)
+
+    def start_telemetry(self, interval=.01, size=1024, errors=True):
+        """Sample the state of all axes in the background.
+
+        Every `interval` the actual position (``TP?``) and motion done
+        status (``MD?``) of all axes and the error code (``TE?``) are read
+        in one exchange (see :meth:`ask_many`). The snapshots are kept in a
+        ring buffer (:meth:`history`) and can answer :meth:`position` and
+        :meth:`done` (see the `max_age` argument of :meth:`ask`).
+
+        Reading the error code removes it from the controller's error
+        queue. Errors read by the poller are logged and recorded in the
+        snapshots only. Pass ``errors=False`` to leave them to
+        :meth:`error_code`.
+
+        Args:
+            interval (float): Sampling interval in seconds.
+            size (int): Number of snapshots kept.
+            errors (bool): Also sample the error code.
+        """
+        self.stop_telemetry()
+        self._telemetry = TelemetryBuffer(size)
+        self._telemetry_task = asyncio.ensure_future(
+            self._poll_telemetry(interval, errors))
+
+    def stop_telemetry(self):
+        """Stop the background sampling started by
+        :meth:`start_telemetry`."""
+        if self._telemetry_task is not None:
+            self._telemetry_task.cancel()
+            self._telemetry_task = None
+
+    async def _poll_telemetry(self, interval, errors):
+        loop = asyncio.get_event_loop()
+        buf = self._telemetry
+        c = buf.channels
+        axes = range(1, c + 1)
+        cmds = [("TP?", xx) for xx in axes] + [("MD?", xx) for xx in axes]
+        if errors:
+            cmds.append(("TE?",))
+        t_next = loop.time()
+        while True:
+            # the state is at least as new as the time of the request
+            t = time.time()
+            try:
+                ret = await self.ask_many(cmds)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("telemetry failed", exc_info=True)
+            else:
+                err = ret[2*c] if errors else 0
+                if err:
+                    logger.warning("error code %d", err)
+                buf.append(t, ret[:c], ret[c:2*c], err)
+            t_next = max(t_next + interval, loop.time())
+            await asyncio.sleep(t_next - loop.time())
+
+    def _sampled(self, cmd, xx, max_age):
+        if self._telemetry is None or cmd not in ("TP?", "MD?") or \
+                xx is None:
+            return None
+        snap = self._telemetry.latest()
+        if snap is None:
+            return None
+        t, position, done, error = snap
+        if t <= self._command_time or time.time() - t > max_age:
+            return None
+        return str(position[xx - 1] if cmd == "TP?" else done[xx - 1])
+
+    def history(self, since=None):
+        """Return the telemetry snapshots.
+
+        Args:
+            since (float): Only return snapshots taken after this time
+                (`time.time()`).
+
+        Returns:
+            list: ``(t, position, done, error)`` tuples, oldest first.
+            ``position`` and ``done`` are lists with one entry per axis.
+        """
+        if self._telemetry is None:
+            return []
+        return self._telemetry.history(since)
 
     async def ping(self):
         try:
@@ -0,0 +1,192 @@
+import logging
+import asyncio
+from collections import deque
+
+from .protocol import NewFocus8742Protocol
+from .trace import WRITE, READ, SETTING, TraceWriter, read_trace
+
+logger = logging.getLogger(__name__)
+
+
+class NewFocus8742Record(NewFocus8742Protocol):
+    """Record the exchange with a controller to a trace file.
+
+    Wraps another driver (e.g. :class:`NewFocus8742TCP` or
+    :class:`NewFocus8742USB`) and records every line written to and read
+    from it with time stamps (see :class:`newfocus8742.trace.TraceWriter`).
+    The records hold the lines without terminators. The trace can be
+    played back with :class:`NewFocus8742Replay`.
+
+    The pipeline depth of `dev` is used without adaptation (see
+    :attr:`NewFocus8742Protocol.adaptive_depth`) and stored in the trace:
+    the lines are then written in the same order when played back.
+
+    Args:
+        dev (NewFocus8742Protocol): Driver to record.
+        f (file): Binary file opened for writing.
+    """
+    adaptive_depth = False
+
+    def __init__(self, dev, f):
+        super().__init__()
+        self.dev = dev
+        self.pipeline_depth = dev.pipeline_depth
+        self.f = f
+        self._trace = TraceWriter(f)
+        self._trace.write(SETTING, "pipeline_depth={}".format(
+            self.pipeline_depth).encode())
+
+    @classmethod
+    async def connect(cls, path, transport, *args, **kwargs):
+        """Connect to a controller and record to a trace file.
+
+        Args:
+            path (str): Trace file name.
+            transport (type): Driver class, e.g. :class:`NewFocus8742TCP`.
+            *args, **kwargs: Passed to the `connect()` of `transport`.
+
+        Returns:
+            NewFocus8742Record: Driver instance.
+        """
+        dev = await transport.connect(*args, **kwargs)
+        return cls(dev, open(path, "wb"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.f.close()
+        self.dev.close()
+
+    def _writeline(self, cmd):
+        self._trace.write(WRITE, cmd.encode())
+        self.dev._writeline(cmd)
+
+    async def _readline(self):
+        r = await self.dev._readline()
+        self._trace.write(READ, r.encode())
+        return r
+
+    async def _sleep(self, t):
+        await self.dev._sleep(t)
+
+
+class NewFocus8742Replay(NewFocus8742Protocol):
+    """Play back a trace recorded with :class:`NewFocus8742Record`.
+
+    The lines written need to match the recorded ones, in order. Each
+    response is returned once the query line it answers has been written
+    and, at `speed` other than zero, after the recorded delay from that
+    write, scaled by `speed`. The pipeline depth stored in the trace is
+    used without adaptation (see :class:`NewFocus8742Record`).
+
+    Args:
+        records (iterable): ``(t, direction, data)`` tuples, see
+            :func:`newfocus8742.trace.read_trace`.
+        speed (float): Playback speed relative to the recording. Zero
+            plays back as fast as possible.
+    """
+    adaptive_depth = False
+
+    def __init__(self, records, speed=1.):
+        super().__init__()
+        self.speed = speed
+        # lines to be written
+        self._writes = deque()
+        # (index of the write answered, delay after that write, line)
+        self._reads = deque()
+        # [index, number of responses missing] of the query lines written
+        # and not answered yet
+        answering = deque()
+        t_writes = []
+        for t, direction, data in records:
+            if direction == WRITE:
+                line = data.decode()
+                n = sum(cmd.strip().endswith("?")
+                        for cmd in line.split(self.sep))
+                if n:
+                    answering.append([len(self._writes), n])
+                self._writes.append(line)
+                t_writes.append(t)
+            elif direction == READ:
+                line = data.decode()
+                if answering:
+                    i, n = answering[0]
+                    n -= len(line.split(self.sep, n - 1))
+                    if n > 0:
+                        answering[0][1] = n
+                    else:
+                        answering.popleft()
+                else:
+                    # unsolicited, after the last write
+                    i = len(self._writes) - 1
+                self._reads.append((
+                    i, 0. if i < 0 else t - t_writes[i], line))
+            elif direction == SETTING:
+                name, value = data.decode().split("=", 1)
+                if name == "pipeline_depth":
+                    self.pipeline_depth = int(value)
+            else:
+                raise ValueError("invalid direction {!r}".format(direction))
+        # time of each write during playback
+        self._write_times = []
+        self._written = asyncio.Event()
+
+    @classmethod
+    async def connect(cls, path, speed=1.):
+        """Play back a trace file.
+
+        Args:
+            path (str): Trace file name.
+            speed (float): See :class:`NewFocus8742Replay`.
+
+        Returns:
+            NewFocus8742Replay: Driver instance.
+        """
+        with open(path, "rb") as f:
+            return cls(list(read_trace(f)), speed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._writes:
+            raise ValueError("{} lines not played back, next {!r}".format(
+                len(self._writes), self._writes[0]))
+
+    def _writeline(self, cmd):
+        if not self._writes:
+            raise ValueError("end of trace, got {!r}".format(cmd))
+        if self._writes[0] != cmd:
+            raise ValueError("expected {!r}, got {!r}".format(
+                self._writes[0], cmd))
+        self._writes.popleft()
+        self._write_times.append(asyncio.get_event_loop().time())
+        self._written.set()
+
+    async def _readline(self):
+        if not self._reads:
+            raise ValueError("end of trace")
+        i, delay, line = self._reads[0]
+        while len(self._write_times) <= i:
+            self._written.clear()
+            await self._written.wait()
+        if self.speed and i >= 0:
+            loop = asyncio.get_event_loop()
+            t = self._write_times[i] + delay/self.speed - loop.time()
+            if t > 0:
+                await asyncio.sleep(t)
+        self._reads.popleft()
+        return line
+
+    async def _sleep(self, t):
+        if self.speed:
+            await asyncio.sleep(t/self.speed)
+        else:
+            await asyncio.sleep(0)
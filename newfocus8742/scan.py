@@ -0,0 +1,129 @@
+import asyncio
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Error:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+_end = object()
+
+
+class Scan:
+    """Move through a sequence of points and measure at each.
+
+    The points are consumed lazily and the scan runs ahead of the
+    consumer by up to `buffer` results: memory stays bounded for long
+    scans. For each point the moves of all its axes are written in one
+    line. The end of the moves is predicted and the axes are then polled
+    together (see :meth:`NewFocus8742Protocol.finish_all`). Axes whose
+    absolute target does not change are not moved. Once all axes are done,
+    `measure` is called and the next point is started. The moves to a
+    point are only written once the previous point has been measured:
+    there is no look-ahead of the moves.
+
+    Use as an asynchronous iterator within an asynchronous context. The
+    context stops the scan if the consumer does not take all results
+    (e.g. on ``break``)::
+
+        points = ({1: x, 2: y} for y in range(0, 1000, 100)
+                  for x in range(0, 1000, 10))
+        async with Scan(dev, points, measure) as scan:
+            async for point, value in scan:
+                ...
+
+    Without the context, call :meth:`aclose` when stopping early.
+
+    Args:
+        dev (NewFocus8742Protocol): Driver.
+        points (iterable or asynchronous iterable): Dictionaries of target
+            positions by axis.
+        measure (callable): Called with the point once it has been
+            reached. May return an awaitable. The result is yielded with
+            the point.
+        relative (bool): Move by the given amounts (``PR``) instead of to
+            the given positions (``PA``).
+        buffer (int): Number of results kept before the consumer takes
+            them.
+    """
+    def __init__(self, dev, points, measure=None, relative=False, buffer=16):
+        self.dev = dev
+        self.points = points
+        self.measure = measure
+        self.relative = relative
+        self._queue = asyncio.Queue(maxsize=buffer)
+        self._task = None
+        # last absolute target by axis
+        self._target = {}
+
+    def __aiter__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def __anext__(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        item = await self._queue.get()
+        if item is _end:
+            raise StopAsyncIteration
+        if isinstance(item, _Error):
+            raise item.exc
+        return item
+
+    def cancel(self):
+        """Stop the scan. Moves in progress are not stopped."""
+        if self._task is not None:
+            self._task.cancel()
+
+    async def aclose(self):
+        """Stop the scan and wait until it has stopped. Moves in progress
+        are not stopped."""
+        task = self._task
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        try:
+            if hasattr(self.points, "__aiter__"):
+                async for point in self.points:
+                    await self._queue.put(await self._step(point))
+            else:
+                for point in self.points:
+                    await self._queue.put(await self._step(point))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._queue.put(_Error(e))
+        await self._queue.put(_end)
+
+    async def _step(self, point):
+        if self.relative:
+            moves = [("PR", xx, n) for xx, n in point.items() if n]
+        else:
+            moves = [("PA", xx, n) for xx, n in point.items()
+                     if self._target.get(xx) != n]
+            for cmd, xx, n in moves:
+                self._target[xx] = n
+        if moves:
+            self.dev.do_many(moves)
+            await self.dev.finish_all([xx for cmd, xx, n in moves])
+        value = None
+        if self.measure is not None:
+            value = self.measure(point)
+            if inspect.isawaitable(value):
+                value = await value
+        return point, value
@@ -1,37 +1,187 @@
 import asyncio
 import logging
-import re
-import random
+import math
+import time
+from collections import deque
 
 
-from .protocol import NewFocus8742Protocol
+from .protocol import NewFocus8742Protocol, _mnemonics
 
 
 logger = logging.getLogger(__name__)
 
 
-class NewFocus8742Sim(NewFocus8742Protocol):
-    channels = 4
+class VirtualClock:
+    """Simulation time independent of the wall clock.
+
+    The time starts at zero. It advances `rate` times as fast as the
+    monotonic clock (not at all if `rate` is zero), by `step` for every
+    command the simulation executes and explicitly with :meth:`advance`.
+    With `rate` zero the simulation is deterministic.
+
+    Args:
+        rate (float): Speed relative to real time.
+        step (float): Time per executed command in seconds.
+    """
+    def __init__(self, rate=0., step=0.):
+        self.rate = rate
+        self.step = step
+        self._offset = 0.
+        self._start = time.monotonic()
+
+    def __call__(self):
+        t = self._offset
+        if self.rate:
+            t += self.rate*(time.monotonic() - self._start)
+        return t
+
+    def advance(self, dt):
+        """Advance the time by `dt` seconds."""
+        self._offset += dt
+
+    def tick(self):
+        """Advance the time by one command step."""
+        self._offset += self.step
+
+
+class _Axis:
+    """Motion of a simulated axis.
 
+    The trajectory is a list of phases of constant acceleration
+    ``(t, position, velocity, acceleration)``, each valid until the
+    next one starts. The motion is done at :attr:`end`.
+    """
     def __init__(self):
-        self.position = [0 for i in range(self.channels)]
+        self.phases = [(0., 0., 0., 0.)]
+        self.end = 0.
+
+    def state(self, t):
+        """Position and velocity at time `t`."""
+        for t0, p0, v0, a0 in reversed(self.phases):
+            if t >= t0:
+                break
+        dt = t - t0
+        return p0 + (v0 + .5*a0*dt)*dt, v0 + a0*dt
+
+    def position(self, t):
+        return int(round(self.state(t)[0]))
+
+    def moving(self, t):
+        return t < self.end
+
+    def set(self, t, position):
+        self.phases = [(t, position, 0., 0.)]
+        self.end = t
+
+    def move(self, t, steps, velocity, acceleration):
+        """Start a trapezoidal move by `steps` from rest."""
+        p = self.position(t)
+        s = 1 if steps >= 0 else -1
+        d = abs(steps)
+        a = max(acceleration, 1)
+        if d*a >= velocity**2:
+            t1 = velocity/a
+            d1 = .5*velocity*t1
+            tc = (d - 2*d1)/velocity
+            self.phases = [
+                (t, p, 0., s*a),
+                (t + t1, p + s*d1, s*velocity, 0.),
+                (t + t1 + tc, p + s*(d - d1), s*velocity, -s*a),
+            ]
+            self.end = t + 2*t1 + tc
+        else:
+            t1 = math.sqrt(d/a)
+            self.phases = [
+                (t, p, 0., s*a),
+                (t + t1, p + s*d/2, s*a*t1, -s*a),
+            ]
+            self.end = t + 2*t1
+        self.phases.append((self.end, p + s*d, 0., 0.))
+
+    def jog(self, t, direction, velocity, acceleration):
+        """Start an indefinite move."""
+        p = self.position(t)
+        s = 1 if direction >= 0 else -1
+        a = max(acceleration, 1)
+        t1 = velocity/a
+        self.phases = [
+            (t, p, 0., s*a),
+            (t + t1, p + s*.5*velocity*t1, s*velocity, 0.),
+        ]
+        self.end = math.inf
+
+    def stop(self, t, acceleration):
+        """Decelerate to rest."""
+        if not self.moving(t):
+            return
+        p, v = self.state(t)
+        a = max(acceleration, 1)
+        t1 = abs(v)/a
+        self.phases = [
+            (t, p, v, -math.copysign(a, v)),
+            (t + t1, int(round(p + .5*v*t1)), 0., 0.),
+        ]
+        self.end = t + t1
+
+    def abort(self, t):
+        """Stop immediately."""
+        if self.moving(t):
+            self.set(t, self.position(t))
+
+
+class NewFocus8742Sim(NewFocus8742Protocol):
+    """Simulated 8742 controller.
+
+    The moves follow trapezoidal velocity profiles given by the
+    velocity and acceleration settings. Position (``TP?``), motion done
+    (``MD?``) and the "MOTION IN PROGRESS" error follow from that model.
+
+    Waiting for motion (e.g. :meth:`finish`) uses the simulation time:
+    with a :class:`VirtualClock` it takes ``1/rate`` of the simulated
+    time or, if the clock is frozen (``rate=0``), advances the clock
+    instead of sleeping.
+
+    Args:
+        clock (callable): Simulation time in seconds, e.g. a
+            :class:`VirtualClock`. Defaults to the monotonic clock.
+    """
+    channels = 4
+    errors = {
+        0: "NO ERROR DETECTED",
+        6: "COMMAND DOES NOT EXIST",
+        7: "PARAMETER OUT OF RANGE",
+        14: "MOTION IN PROGRESS",
+    }
+    motion_in_progress = 14
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self._tick = getattr(clock, "tick", None)
+        self._motion.clock = clock
+        self._axes = [_Axis() for i in range(self.channels)]
         self.home = [0 for i in range(self.channels)]
         self.target = [0 for i in range(self.channels)]
         self.velocity = [2000 for i in range(self.channels)]
         self.acceleration = [100000 for i in range(self.channels)]
-        self.pending = []
+        self.error_queue = []
+        self.pending = deque()
+        self._table = self._dispatch_table()
+        # parsed commands by command string
+        self._parsed = {}
 
     @classmethod
-    async def connect(cls, *args, **kwargs):
+    async def connect(cls, *args, clock=time.monotonic, **kwargs):
         """Connect to a Newfocus/Newport 8742 controller simulation.
 
         Args:
+            clock (callable): See :class:`NewFocus8742Sim`.
             any: ignored
 
         Returns:
             NewFocus8742: Driver instance.
         """
-        return cls()
+        return cls(clock)
 
     def __enter__(self):
         return self
@@ -43,39 +193,136 @@ class NewFocus8742Sim(NewFocus8742Protocol):
         if self.pending:
             raise ValueError("pending data {}".format(self.pending))
 
-    def _writeline(self, cmd):
-        m = re.match(r"^(?P<xx>\d)?\s*\*?(?P<cmd>[a-zA-Z]+)\s*"
-                r"(?P<nn>\d+(,\s*\d+)*)?(?P<ask>\?)?$", cmd)
-        assert m
-        d = m.groupdict()
-        if d["ask"] == "?":
-            f = getattr(self, "ask_{}".format(d["cmd"].lower()), None)
-        else:
-            f = getattr(self, "do_{}".format(d["cmd"].lower()), None)
-        kwargs = {}
-        if d["xx"] is not None:
-            kwargs["xx"] = int(d["xx"])
-        if d["nn"]:
-            args = tuple(int(i) for i in d["nn"].split(","))
+    def _writeline(self, line):
+        if self.sep not in line:
+            ret = self._execute(line.strip())
+            if ret is not None:
+                self.pending.append(ret)
+            return
+        ret = []
+        for cmd in line.split(self.sep):
+            r = self._execute(cmd.strip())
+            if r is not None:
+                ret.append(r)
+        if ret:
+            self.pending.append(self.sep.join(ret))
+
+    async def _readline(self):
+        return self.pending.popleft()
+
+    async def _sleep(self, t):
+        rate = getattr(self.clock, "rate", None)
+        if rate is None:
+            await asyncio.sleep(t)
+        elif rate:
+            await asyncio.sleep(t/rate)
         else:
-            args = ()
-        ret = None
-        if f:
-            ret = str(f(*args, **kwargs))
+            # frozen virtual time: skip ahead
+            self.clock.advance(t)
+            await asyncio.sleep(0)
+
+    def _dispatch_table(self):
+        """Map command mnemonics (e.g. "AC", "AC?", "*IDN?") to the bound
+        `do_*` and `ask_*` handlers.
+
+        The handlers are found by name. The mnemonics defined by the
+        protocol are checked against them and their spelling (``*``
+        prefix) is also accepted.
+        """
+        table = {}
+        for name in dir(self):
+            if name.startswith("do_"):
+                table[name[3:].upper()] = getattr(self, name)
+            elif name.startswith("ask_"):
+                table[name[4:].upper() + "?"] = getattr(self, name)
+        for cmd in _mnemonics:
+            f = table.get(cmd.lstrip("*"))
+            if f is None:
+                logger.debug("not simulated: %s", cmd)
+            else:
+                table[cmd] = f
+        return table
+
+    def _parse(self, cmd):
+        """Tokenize a command.
+
+        Returns:
+            tuple: ``(handler, xx, nn, ask)``. The handler is None if
+            the command is not simulated.
+        """
+        # [xx] mnemonic [nn[, nn...]] [?]
+        i, n = 0, len(cmd)
+        xx = None
+        if n and cmd[0].isdigit():
+            xx = int(cmd[0])
+            i = 1
+            while i < n and cmd[i] == " ":
+                i += 1
+        j = i
+        while j < n and (cmd[j].isalpha() or cmd[j] == "*"):
+            j += 1
+        mnemonic = cmd[i:j].upper()
+        rest = cmd[j:]
+        ask = rest.endswith("?")
+        if ask:
+            rest = rest[:-1]
+            mnemonic += "?"
+        nn = tuple(int(v) for v in rest.split(",")) if rest.strip() else ()
+        f = self._table.get(mnemonic)
+        if f is None:
+            logger.warning("cmd ignored: %s", mnemonic)
+        return f, xx, nn, ask
+
+    def _execute(self, cmd):
+        """Execute one command and return the response to a query or
+        None."""
+        if self._tick is not None:
+            self._tick()
+        parsed = self._parsed.get(cmd)
+        if parsed is None:
+            if len(self._parsed) > 1024:
+                self._parsed.clear()
+            parsed = self._parsed[cmd] = self._parse(cmd)
+        f, xx, nn, ask = parsed
+        if f is None:
+            # like the controller: COMMAND DOES NOT EXIST, no response
+            self.error(6)
+            return None
+        if xx is None:
+            ret = f(*nn)
         else:
-            logger.warning("cmd ignored: %s", d["cmd"])
-        if d["ask"] == "?":
+            ret = f(*nn, xx=xx)
+        if ask:
+            assert ret is not None, cmd
+            ret = str(ret)
             assert ret
-            self.pending.append(ret)
+            return ret
 
-    async def _readline(self):
-        return self.pending.pop(0)
+    def error(self, code):
+        """Add an error to the error queue."""
+        self.error_queue.append(code)
+        del self.error_queue[:-10]
+
+    def _pop_error(self):
+        if self.error_queue:
+            return self.error_queue.pop(0)
+        return 0
+
+    def _start(self, xx):
+        """Check whether a move can start on the axis and return the
+        current time."""
+        t = self.clock()
+        if self._axes[xx - 1].moving(t):
+            self.error(100*xx + self.motion_in_progress)
+            return None
+        return t
 
     def ask_tb(self):
-        return "0, NO ERROR"
+        code = self._pop_error()
+        return "{}, {}".format(code, self.errors.get(code % 100, "ERROR"))
 
     def ask_te(self):
-        return 0
+        return self._pop_error()
 
     def ask_idn(self):
         return "Newfocus 8742, simulated"
@@ -90,23 +337,34 @@ class NewFocus8742Sim(NewFocus8742Protocol):
 
     def do_pa(self, nn, xx):
         assert 1 <= xx <= 4
-        self.position[xx - 1] = nn
+        t = self._start(xx)
+        if t is None:
+            return
+        axis = self._axes[xx - 1]
+        self.target[xx - 1] = nn
+        axis.move(t, nn - axis.position(t), self.velocity[xx - 1],
+                  self.acceleration[xx - 1])
 
     def ask_pa(self, xx):
         assert 1 <= xx <= 4
-        return self.position[xx - 1]
+        return self.target[xx - 1]
 
     def do_pr(self, nn, xx):
         assert 1 <= xx <= 4
-        self.position[xx - 1] += nn
+        t = self._start(xx)
+        if t is None:
+            return
+        axis = self._axes[xx - 1]
+        self.target[xx - 1] = axis.position(t) + nn
+        axis.move(t, nn, self.velocity[xx - 1], self.acceleration[xx - 1])
 
     def ask_pr(self, xx):
         assert 1 <= xx <= 4
-        return 0
+        return self.target[xx - 1]
 
     def ask_tp(self, xx):
         assert 1 <= xx <= 4
-        return self.position[xx - 1] - self.home[xx - 1]
+        return self._axes[xx - 1].position(self.clock())
 
     def do_ac(self, nn, xx):
         assert 1 <= xx <= 4
@@ -120,7 +378,15 @@ class NewFocus8742Sim(NewFocus8742Protocol):
         pass
 
     def do_ab(self, xx=None):
-        pass
+        t = self.clock()
+        for axis in self._axes:
+            axis.abort(t)
+
+    def do_st(self, xx=None):
+        t = self.clock()
+        for i, axis in enumerate(self._axes):
+            if xx is None or xx == i + 1:
+                axis.stop(t, self.acceleration[i])
 
     def do_qm(self, *nn, xx):
         assert 1 <= xx <= 4
@@ -136,17 +402,28 @@ class NewFocus8742Sim(NewFocus8742Protocol):
     def do_dh(self, *nn, xx):
         assert 1 <= xx <= 4
         nn = nn[0] if nn else 0
-        self.position[xx - 1] += self.home[xx - 1] - nn
+        self._axes[xx - 1].set(self.clock(), nn)
         self.home[xx - 1] = nn
+        self.target[xx - 1] = nn
+
+    def do_mc(self):
+        t = self.clock()
+        for xx in range(1, self.channels + 1):
+            if self._axes[xx - 1].moving(t):
+                self.error(100*xx + self.motion_in_progress)
 
     def ask_md(self, xx):
         assert 1 <= xx <= 4
-        return random.randint(0, 1)
+        return int(not self._axes[xx - 1].moving(self.clock()))
 
     def do_mv(self, *nn, xx):
         assert 1 <= xx <= 4
+        t = self._start(xx)
+        if t is None:
+            return
         nn = nn[0] if nn else 1
-        self.position[xx - 1] += nn
+        self._axes[xx - 1].jog(t, nn, self.velocity[xx - 1],
+                               self.acceleration[xx - 1])
 
     def ask_sa(self):
         return 0
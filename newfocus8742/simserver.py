@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import logging
+import random
+
+from .sim import NewFocus8742Sim, VirtualClock
+
+
+logger = logging.getLogger(__name__)
+
+
+class SimServer:
+    """Serve a simulated controller over TCP.
+
+    Speaks the line protocol of the controller's Ethernet/telnet port: a
+    six byte banner on connection, commands terminated by CR (LF is
+    accepted as well), possibly several joined with semicolons, and
+    responses terminated by CRLF. All connections talk to the same
+    simulated controller.
+
+    Args:
+        sim (NewFocus8742Sim): Simulated controller. A new one if None.
+        latency (float): Processing time per command in seconds.
+        jitter (float): Additional uniformly distributed random processing
+            time per command in seconds.
+    """
+    # telnet: IAC WILL ECHO, IAC WILL SUPPRESS-GO-AHEAD
+    banner = b"\xff\xfb\x01\xff\xfb\x03"
+    eol_write = b"\r\n"
+    # longest line accepted
+    limit = 1 << 16
+
+    def __init__(self, sim=None, latency=0., jitter=0.):
+        if sim is None:
+            sim = NewFocus8742Sim()
+        self.sim = sim
+        self.latency = latency
+        self.jitter = jitter
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening.
+
+        Args:
+            host (str): Address to bind to.
+            port (int): Port to bind to. Zero picks a free port.
+
+        Returns:
+            int: The port.
+        """
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        """Stop listening."""
+        self.server.close()
+
+    async def wait_closed(self):
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        logger.info("connection from %s", peer)
+        writer.write(self.banner)
+        buf = b""
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                # CR, LF or CRLF terminated, the remainder is incomplete
+                lines = (buf + data).splitlines(True)
+                buf = b""
+                if not lines[-1].endswith((b"\r", b"\n")):
+                    buf = lines.pop()
+                    if len(buf) > self.limit:
+                        logger.warning("line too long")
+                        break
+                for line in lines:
+                    line = line.decode().strip()
+                    if line:
+                        await self._process(line, writer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            logger.info("connection from %s closed", peer)
+            writer.close()
+
+    async def _process(self, line, writer):
+        sim = self.sim
+        try:
+            sim._writeline(line)
+        except Exception:
+            logger.warning("failed to execute %r", line, exc_info=True)
+            sim.error(6)
+        ret = list(sim.pending)
+        sim.pending.clear()
+        if self.latency or self.jitter:
+            n = line.count(sim.sep) + 1
+            await asyncio.sleep(n*self.latency +
+                                sum(random.uniform(0, self.jitter)
+                                    for i in range(n)))
+        for r in ret:
+            writer.write(r.encode() + self.eol_write)
+        await writer.drain()
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        description="Simulated New Focus 8742 controller on a TCP port")
+    parser.add_argument("--bind", default="127.0.0.1",
+                        help="address to bind to (default: %(default)s)")
+    parser.add_argument("-p", "--port", default=2323, type=int,
+                        help="port to listen on (default: %(default)s)")
+    parser.add_argument("--latency", default=0., type=float,
+                        help="processing time per command in seconds "
+                             "(default: %(default)s)")
+    parser.add_argument("--jitter", default=0., type=float,
+                        help="additional random processing time per "
+                             "command in seconds (default: %(default)s)")
+    parser.add_argument("--rate", default=None, type=float,
+                        help="run the simulated motion this many times "
+                             "faster than real time")
+    parser.add_argument("-v", "--verbose", default=0, action="count",
+                        help="increase logging level")
+    return parser
+
+
+def main():
+    args = get_argparser().parse_args()
+    logging.basicConfig(level=logging.WARNING - 10*args.verbose)
+
+    loop = asyncio.get_event_loop()
+    if args.rate is None:
+        sim = NewFocus8742Sim()
+    else:
+        sim = NewFocus8742Sim(VirtualClock(rate=args.rate))
+    server = SimServer(sim, args.latency, args.jitter)
+    port = loop.run_until_complete(server.start(args.bind, args.port))
+    logger.info("listening on %s:%s", args.bind, port)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+
+
+if __name__ == "__main__":
+    main()
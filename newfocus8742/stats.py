@@ -0,0 +1,172 @@
+import math
+import re
+import time
+
+
+class Histogram:
+    """Histogram of durations in logarithmic (power of two) buckets.
+
+    Bucket ``i`` counts the values in ``[2**(i - 1), 2**i)`` times the
+    resolution. Smaller values are counted in the first, larger values in
+    the last bucket.
+
+    Args:
+        resolution (float): Upper edge of the first bucket (seconds).
+        buckets (int): Number of buckets.
+    """
+    def __init__(self, resolution=1e-6, buckets=28):
+        self.resolution = resolution
+        self.counts = [0]*buckets
+        self.n = 0
+        self.total = 0.
+        self.max = 0.
+        # time.time() of the largest value
+        self.max_time = None
+
+    def add(self, v):
+        i = math.frexp(v/self.resolution)[1]
+        if i < 0:
+            i = 0
+        elif i >= len(self.counts):
+            i = len(self.counts) - 1
+        self.counts[i] += 1
+        self.n += 1
+        self.total += v
+        if v > self.max:
+            self.max = v
+            self.max_time = time.time()
+
+    def percentile(self, q):
+        """Upper bucket edge below which `q` percent (0-100) of the values
+        lie. None if empty."""
+        if not self.n:
+            return None
+        k = q/100*self.n
+        c = 0
+        for i, ci in enumerate(self.counts):
+            c += ci
+            if c >= k and c:
+                break
+        return self.resolution*2**i
+
+    def as_dict(self):
+        return {
+            "n": self.n,
+            "mean": self.total/self.n if self.n else None,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "max_time": self.max_time,
+            # [upper bucket edge, count] of the non-empty buckets
+            "buckets": [[self.resolution*2**i, c]
+                        for i, c in enumerate(self.counts) if c],
+        }
+
+
+class CommandStats:
+    """Counters of one kind of line (see :meth:`LinkStats.key`)."""
+    def __init__(self):
+        self.count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+        # from being queued to being written
+        self.wait = Histogram()
+        # from being written to the last response
+        self.wire = Histogram()
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "errors": self.errors,
+            "wait": self.wait.as_dict(),
+            "wire": self.wire.as_dict(),
+        }
+
+
+_mnemonic = re.compile(r"\s*\d*\s*([*A-Z]+\??)")
+
+
+class LinkStats:
+    """Traffic counters and latency histograms by command.
+
+    Lines are counted by their mnemonics (without axis and parameters,
+    e.g. ``"TP?"``). Lines with several commands joined by `sep` are
+    counted by the mnemonics joined by `sep`, in order of first
+    appearance and with their number if repeated (e.g. ``"TP?;MD?"`` or
+    ``"TP?*4;MD?*4"``). Byte counts exclude the line terminators.
+
+    Args:
+        sep (str): Command separator.
+    """
+    def __init__(self, sep=";"):
+        self.sep = sep
+        # mnemonic key by line, the lines mostly repeat
+        self._keys = {}
+        self.reset()
+
+    def reset(self):
+        """Clear all counters."""
+        self.since = time.time()
+        self.commands = {}
+        # number of queries in flight when a query was written: count
+        self.depth = {}
+        # time writers were blocked by a full transport write buffer
+        self.blocked = Histogram()
+
+    def key(self, line):
+        """Mnemonics of a line."""
+        key = self._keys.get(line)
+        if key is None:
+            counts = {}
+            keys = []
+            for cmd in line.split(self.sep):
+                m = _mnemonic.match(cmd)
+                cmd = m.group(1) if m else cmd.strip()
+                if cmd not in counts:
+                    counts[cmd] = 0
+                    keys.append(cmd)
+                counts[cmd] += 1
+            key = self.sep.join(
+                cmd if counts[cmd] == 1 else "{}*{}".format(cmd, counts[cmd])
+                for cmd in keys)
+            if len(self._keys) > 1024:
+                self._keys.clear()
+            self._keys[line] = key
+        return key
+
+    def get(self, key):
+        stats = self.commands.get(key)
+        if stats is None:
+            stats = self.commands[key] = CommandStats()
+        return stats
+
+    def sent(self, line, wait=None, depth=None):
+        """Count a line written.
+
+        Args:
+            line (str): The line.
+            wait (float): Time it waited in the queue.
+            depth (int): Number of queries in flight before it.
+
+        Returns:
+            CommandStats: Its counters.
+        """
+        stats = self.get(self.key(line))
+        stats.count += 1
+        stats.bytes_sent += len(line)
+        if wait is not None:
+            stats.wait.add(wait)
+        if depth is not None:
+            self.depth[depth] = self.depth.get(depth, 0) + 1
+        return stats
+
+    def as_dict(self):
+        return {
+            "since": self.since,
+            "commands": {k: v.as_dict() for k, v in self.commands.items()},
+            "depth": sorted(self.depth.items()),
+            "blocked": self.blocked.as_dict(),
+        }
@@ -1,7 +1,10 @@
 import logging
 import asyncio
+import socket
+import time
 
 from .protocol import NewFocus8742Protocol
+from .trace import WRITE, READ
 
 logger = logging.getLogger(__name__)
 
@@ -9,10 +12,44 @@ logger = logging.getLogger(__name__)
 class NewFocus8742TCP(NewFocus8742Protocol):
     eol_write = b"\r"
     eol_read = b"\r\n"
+    pipeline_depth = 8
+    timeout = 1.
+    # reconnection attempts back off geometrically up to
+    # reconnect_interval_max, see start_supervisor()
+    reconnect_interval = .1
+    reconnect_backoff = 2.
+    reconnect_interval_max = 2.
+    connect_timeout = 3.
+    # Writing stops while the transport write buffer holds more than
+    # write_high bytes and resumes once it is below write_low, see drain().
+    write_high = 4096
+    write_low = 1024
+    # TCP_NODELAY: send each flush right away instead of waiting for the
+    # acknowledgement of the previous segment
+    nodelay = True
 
-    def __init__(self, reader, writer):
+    def __init__(self, reader, writer, address=None):
+        super().__init__()
         self._reader = reader
         self._writer = writer
+        self._setup()
+        # lines written during a flush, sent together
+        self._cork = None
+        self._draining = None
+        # (host, port, kwargs) to reconnect to
+        self._address = address
+        self._supervisor = None
+        self._reconnecting = None
+        # last velocity, acceleration and home set by (cmd, xx)
+        self._session = {}
+
+    @classmethod
+    async def _open(cls, host, port, **kwargs):
+        reader, writer = await asyncio.open_connection(host, port, **kwargs)
+        # undocumented? garbage?
+        v = await reader.read(6)
+        logger.debug("identifier/serial (?): %s", v)
+        return reader, writer
 
     @classmethod
     async def connect(cls, host, port=23, **kwargs):
@@ -24,11 +61,8 @@ class NewFocus8742TCP(NewFocus8742Protocol):
         Returns:
             NewFocus8742: Driver instance.
         """
-        reader, writer = await asyncio.open_connection(host, port, **kwargs)
-        # undocumented? garbage?
-        v = await reader.read(6)
-        logger.debug("identifier/serial (?): %s", v)
-        return cls(reader, writer)
+        reader, writer = await cls._open(host, port, **kwargs)
+        return cls(reader, writer, (host, port, kwargs))
 
     def __enter__(self):
         return self
@@ -37,12 +71,176 @@ class NewFocus8742TCP(NewFocus8742Protocol):
         self.close()
 
     def close(self):
+        self.stop_supervisor()
+        if self._draining is not None:
+            self._draining.cancel()
         self._writer.close()
 
+    def _setup(self):
+        self._writer.transport.set_write_buffer_limits(
+            self.write_high, self.write_low)
+        sock = self._writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                            int(self.nodelay))
+
     def _writeline(self, cmd):
-        self._writer.write(cmd.encode() + self.eol_write)
+        data = cmd.encode() + self.eol_write
+        self._recorder.record(WRITE, data)
+        if self._cork is not None:
+            self._cork.append(data)
+        else:
+            self._writer.write(data)
+
+    async def drain(self):
+        """Wait until the write buffer is below :attr:`write_low` if it is
+        above :attr:`write_high`.
+
+        Commands and queries are held back while the write buffer is full.
+        Producers that do not wait for responses (e.g. loops of
+        :meth:`do`) should await this to keep the queue bounded.
+        """
+        if self._writer.transport.get_write_buffer_size() <= self.write_high:
+            return
+        t = time.monotonic()
+        await self._writer.drain()
+        self._stats.blocked.add(time.monotonic() - t)
+
+    async def _drain_flush(self):
+        try:
+            await self.drain()
+        finally:
+            self._draining = None
+        self._flush()
+
+    def get_stats(self):
+        ret = super().get_stats()
+        ret["write_buffer"] = self._writer.transport.get_write_buffer_size()
+        return ret
 
     async def _readline(self):
         r = await self._reader.readline()
-        assert r.endswith(self.eol_read)
+        self._recorder.record(READ, r)
+        if not r:
+            self._lost()
+            raise ConnectionError("connection closed")
+        if not r.endswith(self.eol_read):
+            self._dump_trace("unterminated response {!r}".format(r))
+            raise AssertionError(r)
         return r[:-2].decode()
+
+    def _flush(self):
+        transport = self._writer.transport
+        if transport.is_closing():
+            self._lost()
+        if transport.get_write_buffer_size() > self.write_high:
+            if self._draining is None:
+                self._draining = asyncio.ensure_future(self._drain_flush())
+            return
+        self._cork = []
+        try:
+            super()._flush()
+        finally:
+            data, self._cork = b"".join(self._cork), None
+            if data:
+                self._writer.write(data)
+
+    def _track(self, cmd, xx=None, *nn):
+        super()._track(cmd, xx, *nn)
+        if cmd in ("*RCL", "*RST"):
+            # the controller reloads its settings
+            self._session.clear()
+        elif cmd in ("VA", "AC") and nn:
+            self._session[(cmd, xx)] = nn[0]
+        elif cmd == "DH":
+            self._session[(cmd, xx)] = nn[0] if nn else 0
+
+    def start_supervisor(self, interval=1.):
+        """Check the connection and reconnect when it is lost.
+
+        Every `interval` the connection is checked with :meth:`ping`. If
+        that fails or the connection is closed, the driver reconnects
+        with backoff from :attr:`reconnect_interval` to
+        :attr:`reconnect_interval_max`. Queries in flight are queued
+        again and, like new commands and queries, held back until the
+        connection is back. After reconnecting, the velocity and
+        acceleration last set are set again, and so is the home position
+        if the controller does not report it anymore (it is reset to zero
+        when the controller restarts). Then the held back traffic is
+        written.
+
+        Args:
+            interval (float): Health check interval in seconds.
+        """
+        self.stop_supervisor()
+        self._supervisor = asyncio.ensure_future(self._supervise(interval))
+
+    def stop_supervisor(self):
+        """Stop the supervision started by :meth:`start_supervisor`."""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+            self._reconnecting = None
+
+    async def _supervise(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if self._reconnecting is None and not await self.ping():
+                self._lost()
+
+    def _lost(self):
+        """Start reconnecting if supervised."""
+        if self._supervisor is None or self._reconnecting is not None:
+            return
+        logger.warning("connection lost, reconnecting")
+        self._paused = True
+        self._reconnecting = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        try:
+            if self._pump is not None:
+                self._pump.cancel()
+            self._requeue()
+            self._writer.close()
+            host, port, kwargs = self._address
+            interval = self.reconnect_interval
+            while True:
+                try:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        self._open(host, port, **kwargs),
+                        self.connect_timeout)
+                    self._setup()
+                    await self._restore()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.info("reconnection failed", exc_info=True)
+                    self._writer.close()
+                    await asyncio.sleep(interval)
+                    interval = min(interval*self.reconnect_backoff,
+                                   self.reconnect_interval_max)
+                else:
+                    break
+            logger.warning("reconnected")
+            self._paused = False
+            self._flush()
+        finally:
+            self._reconnecting = None
+
+    async def _restore(self):
+        """Set the session state again after reconnecting."""
+        session = list(self._session.items())
+        for line, n in self._join(self.fmt_cmd(cmd, xx, nn)
+                                  for (cmd, xx), nn in session
+                                  if cmd != "DH"):
+            self._writeline(line)
+        for (cmd, xx), nn in session:
+            if cmd != "DH":
+                continue
+            self._writeline(self.fmt_cmd("DH?", xx))
+            home = await asyncio.wait_for(self._readline(), self.timeout)
+            if int(home) != nn:
+                logger.warning("restoring home of axis %s", xx)
+                self._writeline(self.fmt_cmd(cmd, xx, nn))
@@ -0,0 +1,78 @@
+import array
+
+
+class TelemetryBuffer:
+    """Fixed size ring buffer of state snapshots.
+
+    Each snapshot holds a time stamp, the actual position and the motion
+    done status of every axis and an error code. The snapshots are stored
+    flat in one preallocated `array.array` of doubles.
+
+    Args:
+        size (int): Number of snapshots kept.
+        channels (int): Number of axes.
+    """
+    def __init__(self, size=1024, channels=4):
+        self.size = size
+        self.channels = channels
+        self.width = 2 + 2*channels
+        self._data = array.array("d", bytes(8*self.width*size))
+        # total number of snapshots appended
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, t, position, done, error=0):
+        """Add a snapshot, replacing the oldest one if full.
+
+        Args:
+            t (float): Time stamp.
+            position (list of int): Actual position of each axis.
+            done (list of int): Motion done status of each axis.
+            error (int): Error code.
+        """
+        i = (self.count % self.size)*self.width
+        c = self.channels
+        d = self._data
+        d[i] = t
+        d[i + 1:i + 1 + c] = array.array("d", position)
+        d[i + 1 + c:i + 1 + 2*c] = array.array("d", done)
+        d[i + 1 + 2*c] = error
+        self.count += 1
+
+    def _get(self, n):
+        i = (n % self.size)*self.width
+        c = self.channels
+        d = self._data
+        return (d[i], [int(p) for p in d[i + 1:i + 1 + c]],
+                [int(m) for m in d[i + 1 + c:i + 1 + 2*c]],
+                int(d[i + 1 + 2*c]))
+
+    def latest(self):
+        """Return the newest snapshot.
+
+        Returns:
+            tuple: ``(t, position, done, error)`` or None if empty.
+        """
+        if not self.count:
+            return None
+        return self._get(self.count - 1)
+
+    def history(self, since=None):
+        """Return the snapshots, oldest first.
+
+        Args:
+            since (float): Only return snapshots taken after this time.
+
+        Returns:
+            list: ``(t, position, done, error)`` tuples.
+        """
+        ret = []
+        for n in range(self.count - 1, self.count - len(self) - 1, -1):
+            i = (n % self.size)*self.width
+            if since is not None and self._data[i] <= since:
+                break
+            ret.append(self._get(n))
+        ret.reverse()
+        return ret
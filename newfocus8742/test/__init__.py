@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from collections import deque
+
+from newfocus8742.sim import NewFocus8742Sim
+
+
+class AsyncTestCase(unittest.TestCase):
+    """Test case with a new event loop for each test.
+
+    The tasks left over by a test are cancelled before the loop is
+    closed.
+    """
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        all_tasks = getattr(asyncio, "all_tasks", None)
+        if all_tasks is None:
+            all_tasks = asyncio.Task.all_tasks
+        tasks = all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(
+            asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coro, timeout=10):
+        """Run a coroutine to completion, failing after `timeout`."""
+        return self.loop.run_until_complete(asyncio.wait_for(coro, timeout))
+
+
+class LinkSim(NewFocus8742Sim):
+    """Simulation with responses that take time to arrive, can get lost
+    and can be split into one line per query."""
+    pipeline_depth = 4
+    adaptive_depth = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # lines written
+        self.lines = []
+        # response delay by line
+        self.delay = {}
+        # lines whose responses get lost
+        self.drop = set()
+        self.split = False
+        # (arrival time, response)
+        self.wire = deque()
+
+    def _writeline(self, line):
+        super()._writeline(line)
+        self.lines.append(line)
+        t = asyncio.get_event_loop().time() + self.delay.get(line, 0.)
+        while self.pending:
+            ret = self.pending.popleft()
+            if line in self.drop:
+                continue
+            rets = ret.split(self.sep) if self.split else [ret]
+            self.wire.extend((t, r) for r in rets)
+
+    async def _readline(self):
+        while not self.wire:
+            await asyncio.sleep(.001)
+        t, ret = self.wire[0]
+        await asyncio.sleep(t - asyncio.get_event_loop().time())
+        self.wire.popleft()
+        return ret
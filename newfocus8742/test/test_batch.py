@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+
+from newfocus8742.sim import VirtualClock
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class BatchTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+        self.dev.delay = {"TE?": .001}
+
+    def settings(self):
+        for xx in range(1, 5):
+            self.dev.set_velocity(xx, 10000 + xx)
+            self.dev.set_acceleration(xx, 20000 + xx)
+
+    def command_lines(self):
+        return [line for line in self.dev.lines if "?" not in line]
+
+    def test_join(self):
+        async def run():
+            async with self.dev.batch():
+                self.settings()
+                self.assertEqual(self.dev.lines, [])
+
+        self.run_async(run())
+        self.assertEqual(len(self.command_lines()), 2)
+
+    def test_background_queries(self):
+        async def background():
+            for i in range(20):
+                await self.dev.error_code()
+
+        async def run():
+            task = asyncio.ensure_future(background())
+            async with self.dev.batch():
+                for xx in range(1, 5):
+                    self.dev.set_velocity(xx, 10000 + xx)
+                    await asyncio.sleep(.001)
+                    self.dev.set_acceleration(xx, 20000 + xx)
+                    await asyncio.sleep(.001)
+            await task
+
+        self.run_async(run())
+        self.assertEqual(len(self.command_lines()), 2)
+
+    def test_query_in_batch(self):
+        async def run():
+            async with self.dev.batch():
+                self.dev.set_velocity(1, 1234)
+                # from another task: goes ahead of the held back commands
+                other = asyncio.ensure_future(self.dev.get_velocity(1))
+                await asyncio.sleep(0)
+                ret = await self.dev.get_velocity(1)
+                self.dev.set_velocity(2, 1002)
+            return await other, ret
+
+        self.assertEqual(self.run_async(run()), (2000, 1234))
+        self.assertEqual(self.dev.lines,
+                         ["1VA?", "1VA1234", "1VA?", "2VA1002"])
+
+    def test_nested(self):
+        async def run():
+            async with self.dev.batch():
+                self.dev.set_velocity(1, 1001)
+                async with self.dev.batch():
+                    self.dev.set_velocity(2, 1002)
+                self.assertEqual(self.dev.lines, [])
+                self.dev.set_velocity(3, 1003)
+
+        self.run_async(run())
+        self.assertEqual(self.dev.lines, ["1VA1001;2VA1002;3VA1003"])
+
+    def test_stop(self):
+        async def run():
+            async with self.dev.batch():
+                self.dev.set_velocity(1, 1001)
+                self.dev.stop(1)
+                self.assertEqual(self.dev.lines, ["1ST"])
+
+        self.run_async(run())
+        self.assertEqual(self.dev.lines, ["1ST", "1VA1001"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from newfocus8742.sim import VirtualClock
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class CacheTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+        self.run_async(self.dev.load_settings())
+        del self.dev.lines[:]
+
+    def tearDown(self):
+        super().tearDown()
+        self.dev.close()
+
+    def settings(self, xx=1):
+        return [self.run_async(get(xx)) for get in (
+            self.dev.get_velocity, self.dev.get_acceleration,
+            self.dev.get_home, self.dev.get_type)]
+
+    def test_hit(self):
+        self.assertEqual(self.settings(), [2000, 100000, 0, 2])
+        self.assertEqual(self.dev.lines, [])
+
+    def test_disabled(self):
+        self.dev.cache_settings = False
+        self.assertEqual(self.run_async(self.dev.get_velocity(1)), 2000)
+        self.assertEqual(self.dev.lines, ["1VA?"])
+
+    def test_update(self):
+        self.dev.set_velocity(1, 1000)
+        self.dev.set_acceleration(1, 50000)
+        self.dev.set_home(1, 10)
+        self.dev.set_type(1, 3)
+        self.assertEqual(self.settings(), [1000, 50000, 10, 3])
+        self.assertFalse([line for line in self.dev.lines if "?" in line])
+        self.dev.set_home(1)
+        self.assertEqual(self.run_async(self.dev.get_home(1)), 0)
+        self.assertFalse([line for line in self.dev.lines if "?" in line])
+
+    def test_invalidate(self):
+        for name in ("recall", "reset", "check_motor"):
+            with self.subTest(name=name):
+                self.run_async(self.dev.load_settings())
+                del self.dev.lines[:]
+                getattr(self.dev, name)()
+                self.assertEqual(self.settings(2), [2000, 100000, 0, 2])
+                self.assertEqual(self.dev.lines[-4:],
+                                 ["2VA?", "2AC?", "2DH?", "2QM?"])
+                self.assertTrue(self.dev.cache_settings)
+
+    def test_move(self):
+        # auto motor detection may change the motor type
+        for move in (lambda: self.dev.set_relative(1, 100),
+                     lambda: self.dev.set_position(2, 100),
+                     lambda: self.dev.move(3)):
+            move()
+        self.dev.stop()
+        for xx in range(1, 5):
+            self.assertEqual(self.run_async(self.dev.get_velocity(xx)), 2000)
+            self.assertEqual(self.run_async(self.dev.get_type(xx)), 2)
+        self.assertEqual([line for line in self.dev.lines if "?" in line],
+                         ["1QM?", "2QM?", "3QM?"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from newfocus8742.flow import FlowControl
+from newfocus8742.sim import VirtualClock
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class FlowControlTest(unittest.TestCase):
+    def setUp(self):
+        self.flow = FlowControl()
+
+    def test_slow_start(self):
+        for i in range(5):
+            self.assertEqual(self.flow.limit(16), i + 1)
+            self.flow.sample("TP?", 1e-3, 16)
+        self.assertEqual(self.flow.window, 6)
+        for i in range(20):
+            self.flow.sample("TP?", 1e-3, 16)
+        self.assertEqual(self.flow.limit(16), 16)
+        self.assertEqual(self.flow.limit(4), 4)
+
+    def test_additive_increase(self):
+        self.flow.window = 4.
+        self.flow.threshold = 4.
+        for i in range(4):
+            self.flow.sample("TP?", 1e-3, 16)
+        self.assertEqual(self.flow.limit(16), 4)
+        self.assertAlmostEqual(self.flow.window, 5., 0)
+        for i in range(5):
+            self.flow.sample("TP?", 1e-3, 16)
+        self.assertEqual(self.flow.limit(16), 5)
+        self.assertAlmostEqual(self.flow.window, 6., 0)
+
+    def test_decrease_once(self):
+        self.flow.window = 8.
+        self.flow.sample("TP?", 1e-3, 16)
+        self.flow.sample("VA?", 5e-3, 16)
+        # the round trip times of the other kinds are independent
+        self.assertEqual(self.flow.window, 10.)
+        self.flow.sample("TP?", 5e-3, 16)
+        self.assertEqual(self.flow.window, 5.)
+        self.assertEqual(self.flow.threshold, 5.)
+        # the responses to the queries in flight are late as well
+        for i in range(9):
+            self.flow.sample("TP?", 5e-3, 16)
+            self.flow.congested()
+        self.assertEqual(self.flow.window, 5.)
+        self.flow.sample("TP?", 5e-3, 16)
+        self.assertEqual(self.flow.window, 2.5)
+        for i in range(5):
+            self.flow.congested()
+        self.assertEqual(self.flow.limit(16), 2)
+
+    def test_minimum(self):
+        self.flow.window = 1.
+        self.flow.congested()
+        self.assertEqual(self.flow.window, 1.)
+        self.assertEqual(self.flow.limit(16), 1)
+
+
+class OverrunTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+        self.dev.adaptive_depth = True
+        self.dev.pipeline_depth = 16
+
+    def tearDown(self):
+        super().tearDown()
+        self.dev.close()
+
+    def test_congested(self):
+        flow = self.dev._flow
+        flow.window = flow.threshold = 8.
+        self.dev.error(7)
+        self.assertEqual(self.run_async(self.dev.error_code()), 7)
+        self.assertEqual(flow.limit(16), 8)
+        for code in self.dev.overrun_errors:
+            with self.subTest(code=code):
+                flow._recover = 0
+                flow.window = flow.threshold = 8.
+                self.dev.error(code)
+                self.assertEqual(self.run_async(self.dev.error_code()), code)
+                self.assertEqual(flow.limit(16), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from newfocus8742.linebuffer import LineBuffer
+
+
+class LineBufferTest(unittest.TestCase):
+    def test_split(self):
+        buf = LineBuffer()
+        for data in (b"12", b"34\r", b"\n5", b"6\r\n"):
+            buf.feed(data)
+        self.assertEqual(buf.readline(), "1234")
+        self.assertEqual(buf.readline(), "56")
+        self.assertIsNone(buf.readline())
+        self.assertEqual(len(buf), 0)
+
+    def test_several(self):
+        buf = LineBuffer()
+        buf.feed(b"1\r\n2;3\r\n\r\n4")
+        self.assertEqual(buf.readline(), "1")
+        self.assertEqual(buf.readline(), "2;3")
+        self.assertEqual(buf.readline(), "")
+        self.assertIsNone(buf.readline())
+        self.assertEqual(len(buf), 1)
+        buf.feed(b"\r\n")
+        self.assertEqual(buf.readline(), "4")
+
+    def test_compact(self):
+        buf = LineBuffer(size=16)
+        for i in range(20):
+            buf.feed(b"123\r\n45")
+            self.assertEqual(buf.readline(), "123")
+            self.assertIsNone(buf.readline())
+            buf.feed(b"6\r\n")
+            self.assertEqual(buf.readline(), "456")
+        # an incomplete line is moved to the front to make room
+        buf.feed(b"1234567890\r\n12")
+        self.assertEqual(buf.readline(), "1234567890")
+        buf.feed(b"34567890123\r\n")
+        self.assertEqual(buf.readline(), "1234567890123")
+
+    def test_overflow(self):
+        buf = LineBuffer(size=8)
+        buf.feed(b"1234")
+        with self.assertRaises(BufferError):
+            buf.feed(b"56789")
+        # the buffered data is kept
+        buf.feed(b"\r\n")
+        self.assertEqual(buf.readline(), "1234")
+        buf.feed(b"12345678")
+        with self.assertRaises(BufferError):
+            buf.feed(b"9")
+        buf.clear()
+        self.assertEqual(len(buf), 0)
+        buf.feed(b"1\r\n")
+        self.assertEqual(buf.readline(), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
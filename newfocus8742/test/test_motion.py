@@ -0,0 +1,97 @@
+import unittest
+
+from newfocus8742.motion import move_time, MotionPredictor
+from newfocus8742.sim import VirtualClock
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class MoveTimeTest(unittest.TestCase):
+    def test_trapezoid(self):
+        # 10 ms for each ramp over 10 steps, 980 steps at full velocity
+        self.assertAlmostEqual(move_time(1000, 2000, 200000), .51)
+        self.assertAlmostEqual(move_time(-1000, 2000, 200000), .51)
+
+    def test_triangle(self):
+        # never reaches the velocity: 5 ms up, 5 ms down
+        self.assertAlmostEqual(move_time(5, 2000, 200000), .01)
+        # the boundary between the two profiles is continuous
+        self.assertAlmostEqual(move_time(20, 2000, 200000), .02)
+        self.assertAlmostEqual(move_time(20, 2000, 200000),
+                               move_time(20 + 1e-9, 2000, 200000))
+        self.assertEqual(move_time(0, 2000, 200000), 0.)
+
+
+class MotionPredictorTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.motion = MotionPredictor(clock=self.clock)
+
+    def test_remaining(self):
+        self.motion.command("VA", 1, 1000)
+        self.motion.command("AC", 1, 1000000)
+        self.motion.command("PR", 1, 1000)
+        self.assertAlmostEqual(self.motion.remaining(1), 1.001)
+        self.assertEqual(self.motion.remaining(2), 0.)
+        self.clock.advance(.5)
+        self.assertAlmostEqual(self.motion.remaining(), .501)
+        # ignored while moving
+        self.motion.command("PR", 1, 5000)
+        self.assertAlmostEqual(self.motion.remaining(1), .501)
+        self.motion.command("ST", 1)
+        self.assertEqual(self.motion.remaining(1), 0.)
+
+    def test_learn(self):
+        duration = move_time(2000, 2000, 100000)
+        # the axis takes twice as long as predicted
+        for i in range(20):
+            self.motion.command("PR", 1, 2000)
+            self.clock.advance(2*duration)
+            self.motion.done(1)
+        self.assertAlmostEqual(self.motion.correction[1 - 1], 2., 1)
+        self.assertEqual(self.motion.correction[2 - 1], 1.)
+        self.motion.command("PR", 1, 2000)
+        self.assertAlmostEqual(self.motion.remaining(1), 2*duration, 1)
+        # the correction factors survive a reset
+        self.motion.command("*RST")
+        self.assertEqual(self.motion.velocity[0], 2000)
+        self.assertAlmostEqual(self.motion.correction[0], 2., 1)
+
+    def test_learn_short(self):
+        self.motion.command("PR", 1, 5)
+        self.clock.advance(1.)
+        self.motion.done(1)
+        self.assertEqual(self.motion.correction[0], 1.)
+
+    def test_learn_clamped(self):
+        self.motion.command("PR", 1, 2000)
+        self.clock.advance(100.)
+        self.motion.done(1)
+        self.assertAlmostEqual(self.motion.correction[0],
+                               1. + self.motion.learning_rate)
+
+
+class ReadBackTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+        # settings from the saved memory of the controller
+        self.dev.velocity[1 - 1] = 1000
+        self.dev.acceleration[2 - 1] = 50000
+
+    def tearDown(self):
+        super().tearDown()
+        self.dev.close()
+
+    def test_ask(self):
+        self.assertEqual(self.run_async(self.dev.get_velocity(1)), 1000)
+        self.assertEqual(self.dev._motion.velocity[0], 1000)
+
+    def test_load_settings(self):
+        self.run_async(self.dev.load_settings())
+        self.assertEqual(self.dev._motion.velocity[:2], [1000, 2000])
+        self.assertEqual(self.dev._motion.acceleration[:2],
+                         [100000, 50000])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import asyncio
+import gc
+import logging
+import unittest
+
+from newfocus8742.sim import VirtualClock
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class ProtocolTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+
+    def tearDown(self):
+        super().tearDown()
+        self.dev.close()
+
+    def velocities(self):
+        for xx in range(1, 5):
+            self.dev.set_velocity(xx, 1000 + xx)
+            self.dev.set_acceleration(xx, 2000 + xx)
+        return [v for xx in range(1, 5) for v in (1000 + xx, 2000 + xx)]
+
+    def test_pipeline_order(self):
+        expect = self.velocities()
+        self.dev.delay = {"2VA?": .02, "3AC?": .01}
+
+        async def run():
+            return await asyncio.gather(*[
+                q for xx in range(1, 5)
+                for q in (self.dev.get_velocity(xx),
+                          self.dev.get_acceleration(xx))])
+
+        self.assertEqual(self.run_async(run()), expect)
+        depth = dict(self.dev.get_stats()["depth"])
+        self.assertEqual(max(depth), self.dev.pipeline_depth - 1)
+
+    def test_ask_many(self):
+        expect = self.velocities()*3
+        cmds = [(cmd, xx) for xx in range(1, 5)
+                for cmd in ("VA?", "AC?")]*3
+        for split in (False, True):
+            with self.subTest(split=split):
+                self.dev.split = split
+                del self.dev.lines[:]
+                self.assertEqual(self.run_async(self.dev.ask_many(cmds)),
+                                 expect)
+                self.assertEqual(len(self.dev.lines), 2)
+                self.assertTrue(all(len(line) < 64
+                                    for line in self.dev.lines))
+
+    def test_timeout_discard(self):
+        expect = self.velocities()
+        self.dev.timeout = .05
+        self.dev.delay = {"1VA?": .08}
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.dev.get_velocity(1))
+        self.assertEqual(self.run_async(self.dev.get_acceleration(1)),
+                         expect[1])
+        self.dev.delay.clear()
+        self.assertEqual(self.run_async(self.dev.get_velocity(1)),
+                         expect[0])
+
+    def test_cancel_discard(self):
+        expect = self.velocities()
+        self.dev.delay = {"1VA?": .02}
+
+        async def run():
+            fut = asyncio.ensure_future(self.dev.get_velocity(1))
+            await asyncio.sleep(.005)
+            fut.cancel()
+            return await self.dev.get_acceleration(1)
+
+        self.assertEqual(self.run_async(run()), expect[1])
+
+    def test_cancel_volatile(self):
+        expect = self.velocities()
+        self.dev.timeout = .03
+        self.dev.delay = {"TE?": .045}
+
+        async def run():
+            fut = asyncio.ensure_future(self.dev.error_code())
+            await asyncio.sleep(.005)
+            fut.cancel()
+            return await self.dev.get_velocity(1)
+
+        # the late response is discarded without resynchronizing
+        self.assertEqual(self.run_async(run()), expect[0])
+        self.assertNotIn("VE?", self.dev.lines)
+
+    def test_read_error(self):
+        expect = self.velocities()
+        readline = self.dev._readline
+
+        async def garbled():
+            self.dev._readline = readline
+            await readline()
+            raise ValueError("garbled")
+        self.dev._readline = garbled
+        self.dev.delay = {"1AC?": .02}
+
+        async def run():
+            first = asyncio.ensure_future(self.dev.get_velocity(1))
+            second = asyncio.ensure_future(self.dev.get_acceleration(1))
+            # clears the frames of the traceback
+            with self.assertRaises(ValueError):
+                await first
+            return await second
+
+        self.assertEqual(self.run_async(run()), expect[1])
+
+    def test_lost_response(self):
+        expect = self.velocities()
+        self.dev.pipeline_depth = 1
+        self.dev.timeout = .02
+        self.dev.drop = {"1VA?"}
+
+        async def run():
+            lost = asyncio.ensure_future(self.dev.get_velocity(1))
+            await asyncio.sleep(0)
+            ret = await self.dev.get_acceleration(1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await lost
+            return ret
+
+        self.assertEqual(self.run_async(run()), expect[1])
+        self.assertEqual(self.dev.lines[-2:], ["VE?", "1AC?"])
+
+    def test_resync(self):
+        expect = self.velocities()
+        loop = asyncio.get_event_loop()
+        self.dev.wire.append((loop.time(), "stray"))
+        self.run_async(self.dev.resync())
+        self.assertFalse(self.dev.wire)
+        self.assertEqual(self.run_async(self.dev.get_velocity(1)),
+                         expect[0])
+
+    def test_coalesce_command(self):
+        self.dev.coalesce_window = .5
+
+        async def run():
+            before = asyncio.ensure_future(self.dev.done(1))
+            await asyncio.sleep(0)
+            self.assertTrue(self.dev._inflight)
+            self.dev.set_relative(1, 2000)
+            self.assertTrue(await before)
+            return await self.dev.done(1)
+
+        self.assertFalse(self.run_async(run()))
+
+    def test_held_move_status_failure(self):
+        self.dev.schedule_moves = True
+
+        async def done(xx=None, max_age=None):
+            raise ValueError(xx)
+        self.dev.done = done
+
+        async def run():
+            self.dev.set_relative(1, 100)
+            await self.dev.finish(1)
+
+        with self.assertRaises(ValueError):
+            self.run_async(run())
+        self.assertNotIn(1, self.dev._busy)
+
+    def test_held_move_status_failure_all(self):
+        self.dev.schedule_moves = True
+
+        async def done(xx=None, max_age=None):
+            raise ValueError(xx)
+        self.dev.done = done
+
+        async def run():
+            self.dev.set_relative(1, 100)
+            await self.dev.finish_all([1])
+
+        with self.assertRaises(ValueError):
+            self.run_async(run())
+
+    def test_held_move_status_failure_unawaited(self):
+        self.dev.schedule_moves = True
+        errors = []
+        self.loop.set_exception_handler(lambda loop, ctx: errors.append(ctx))
+
+        async def done(xx=None, max_age=None):
+            raise ValueError(xx)
+        self.dev.done = done
+
+        async def run():
+            self.dev.set_relative(1, 100)
+            while self.dev._busy:
+                await asyncio.sleep(.001)
+
+        # log records would keep the future alive
+        logger = logging.getLogger("newfocus8742.protocol")
+        logger.disabled = True
+        try:
+            self.run_async(run())
+        finally:
+            logger.disabled = False
+        gc.collect()
+        self.assertEqual(errors, [])
+
+    def test_ask_many_scheduled(self):
+        self.dev.schedule_moves = True
+        for cmd in (("PR", 1, 100), ("MC",), ("ST", 1)):
+            with self.subTest(cmd=cmd):
+                with self.assertRaises(ValueError):
+                    self.run_async(self.dev.ask_many([cmd, ("TP?", 1)]))
+        self.assertEqual(self.dev.lines, [])
+        self.assertEqual(self.run_async(self.dev.ask_many(
+            [("VA", 1, 1001), ("VA?", 1)])), [1001])
+
+    def test_held_moves(self):
+        self.dev.schedule_moves = True
+
+        async def run():
+            self.dev.set_relative(1, 100)
+            self.dev.set_relative(1, 200)
+            self.dev.set_relative(2, 300)
+            self.assertEqual(len(self.dev._held[1]), 1)
+            self.assertNotIn(2, self.dev._held)
+            await self.dev.finish(1)
+            await self.dev.finish(2)
+            return [await self.dev.position(xx) for xx in (1, 2)]
+
+        self.assertEqual(self.run_async(run()), [300, 300])
+        self.assertEqual(self.run_async(self.dev.error_code()), 0)
+
+    def test_stop_drops_held(self):
+        self.dev.schedule_moves = True
+
+        async def run():
+            self.dev.set_relative(1, 100)
+            self.dev.set_relative(1, 200)
+            self.dev.stop(1)
+            self.assertFalse(self.dev._held)
+            await self.dev.finish(1)
+            return await self.dev.position(1)
+
+        self.assertLess(self.run_async(run()), 300)
+        self.assertNotIn("1PR200", self.dev.lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import io
+import unittest
+
+from newfocus8742.sim import NewFocus8742Sim, VirtualClock
+from newfocus8742.replay import NewFocus8742Record, NewFocus8742Replay
+from newfocus8742.trace import read_trace
+from newfocus8742.test import AsyncTestCase
+
+
+async def workload(dev):
+    dev.set_velocity(1, 1234)
+    ret = await asyncio.gather(
+        *[dev.position(xx) for xx in range(1, 5)],
+        dev.get_velocity(1),
+        dev.ask_many([("VA?", 2), ("AC?", 3), ("DH?", 4)]))
+    dev.set_relative(2, 50)
+    ret.append(await dev.get_relative(2))
+    return ret
+
+
+class ReplayTest(AsyncTestCase):
+    def record(self):
+        sim = NewFocus8742Sim(VirtualClock())
+        sim.pipeline_depth = 4
+        f = io.BytesIO()
+        dev = NewFocus8742Record(sim, f)
+        ret = self.run_async(workload(dev))
+        return ret, list(read_trace(io.BytesIO(f.getvalue())))
+
+    def test_round_trip(self):
+        ret, records = self.record()
+        self.assertEqual(ret[4], 1234)
+        for speed in (0., 1.):
+            with self.subTest(speed=speed):
+                dev = NewFocus8742Replay(records, speed)
+                self.assertEqual(dev.pipeline_depth, 4)
+                self.assertFalse(dev.adaptive_depth)
+                self.assertEqual(self.run_async(workload(dev)), ret)
+                dev.close()
+
+    def test_mismatch(self):
+        ret, records = self.record()
+        dev = NewFocus8742Replay(records, 0.)
+        with self.assertRaises(ValueError):
+            dev.set_velocity(1, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
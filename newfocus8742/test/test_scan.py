@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+
+from newfocus8742.sim import VirtualClock
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class ScanTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+
+    def scan(self, scan, n=None):
+        async def run():
+            ret = []
+            async with scan:
+                async for point, value in scan:
+                    ret.append((point, value))
+                    if len(ret) == n:
+                        break
+            return ret
+        return self.run_async(run())
+
+    def test_measure(self):
+        points = [{1: x, 2: y} for y in (0, 20) for x in (0, 10, 30)]
+
+        async def measure(point):
+            return await self.dev.ask_many([("TP?", 1), ("TP?", 2)])
+
+        ret = self.scan(self.dev.scan(iter(points), measure))
+        self.assertEqual(ret, [(p, [p[1], p[2]]) for p in points])
+        # unchanged targets are not moved
+        self.assertEqual(sum(line.count("PA") for line in self.dev.lines),
+                         8)
+        self.assertEqual(self.run_async(self.dev.error_code()), 0)
+
+    def test_relative(self):
+        points = [{1: 10}, {1: 0, 2: 5}, {1: -20}]
+        ret = self.scan(self.dev.scan(points, relative=True))
+        self.assertEqual(ret, [(p, None) for p in points])
+        self.assertEqual(self.run_async(self.dev.position(1)), -10)
+        self.assertEqual(self.run_async(self.dev.position(2)), 5)
+
+    def test_async_points(self):
+        class Points:
+            def __init__(self):
+                self.x = 0
+
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                if self.x >= 3:
+                    raise StopAsyncIteration
+                self.x += 1
+                return {3: self.x}
+
+        ret = self.scan(self.dev.scan(Points(), lambda p: p[3]*2))
+        self.assertEqual([v for p, v in ret], [2, 4, 6])
+
+    def test_measure_error(self):
+        def measure(point):
+            raise ValueError(point)
+
+        with self.assertRaises(ValueError):
+            self.scan(self.dev.scan([{1: 10}], measure))
+
+    def test_break(self):
+        points = ({1: x} for x in range(100))
+        scan = self.dev.scan(points, buffer=2)
+        ret = self.scan(scan, n=3)
+        self.assertEqual(len(ret), 3)
+        self.assertTrue(scan._task.done())
+        self.assertLess(len(self.dev.lines), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from newfocus8742.sim import NewFocus8742Sim, VirtualClock
+
+
+class SimTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = NewFocus8742Sim(self.clock)
+
+    def ask(self, line):
+        self.sim._writeline(line)
+        return self.sim.pending.popleft()
+
+    def test_unknown_query(self):
+        self.sim._writeline("1XX?")
+        self.assertFalse(self.sim.pending)
+        self.assertEqual(self.ask("1XX?;1VA?;1YY"), "2000")
+        self.assertEqual(self.ask("TE?;TE?;TE?;TE?"), "6;6;6;0")
+
+    def trajectory(self, xx, times):
+        """Position and motion done status at the given times."""
+        ret = []
+        for t in times:
+            self.clock.advance(t - self.clock())
+            ret.append(tuple(int(r) for r in self.ask(
+                "{0}TP?;{0}MD?".format(xx)).split(";")))
+        return ret
+
+    def test_relative(self):
+        # 20 ms ramps over 20 steps at 2000 steps/s and 100000 steps/s²
+        self.sim._writeline("1PR1000")
+        self.assertEqual(self.ask("1PR?"), "1000")
+        self.assertEqual(
+            self.trajectory(1, (0., .01, .02, .27, .51, .52, 1.)),
+            [(0, 0), (5, 0), (20, 0), (520, 0), (995, 0), (1000, 1),
+             (1000, 1)])
+        # too short to reach the velocity
+        self.sim._writeline("1PR-10")
+        self.assertEqual(self.trajectory(1, (1.01, 1.02)),
+                         [(995, 0), (990, 1)])
+        self.assertEqual(self.ask("1PR?"), "990")
+        self.assertEqual(self.ask("2TP?;2MD?"), "0;1")
+
+    def test_absolute(self):
+        self.sim._writeline("2PA-1000")
+        self.assertEqual(self.ask("2PA?"), "-1000")
+        self.assertEqual(self.trajectory(2, (.27, .52)),
+                         [(-520, 0), (-1000, 1)])
+        self.sim._writeline("2PA-1000")
+        self.assertEqual(self.trajectory(2, (.53,)), [(-1000, 1)])
+        self.sim._writeline("2DH100")
+        self.sim._writeline("2PA0")
+        self.assertEqual(self.trajectory(2, (.58, 1.)),
+                         [(20, 0), (0, 1)])
+
+    def test_move_stop(self):
+        self.sim._writeline("3MV-1")
+        self.assertEqual(self.trajectory(3, (.02, 1.02)),
+                         [(-20, 0), (-2020, 0)])
+        self.sim._writeline("3ST")
+        # decelerates over 20 ms
+        self.assertEqual(self.trajectory(3, (1.03, 1.04, 2.)),
+                         [(-2035, 0), (-2040, 1), (-2040, 1)])
+
+    def test_abort(self):
+        self.sim._writeline("1PR1000;2MV1")
+        self.assertEqual(self.trajectory(1, (.27,)), [(520, 0)])
+        self.sim._writeline("AB")
+        self.assertEqual(self.trajectory(1, (.27, 1.)), [(520, 1)]*2)
+        self.assertEqual(self.ask("2TP?;2MD?"), "520;1")
+
+    def test_motion_in_progress(self):
+        self.sim._writeline("1PR1000")
+        self.clock.advance(.1)
+        self.sim._writeline("1PR1000;1PA0;1MV1;MC")
+        self.assertEqual(self.ask("TE?;TE?;TE?;TE?;TE?"),
+                         "114;114;114;114;0")
+        self.assertEqual(self.ask("1PR?"), "1000")
+        self.assertEqual(self.trajectory(1, (1.,)), [(1000, 1)])
+        self.sim._writeline("MC;1PR1000")
+        self.assertEqual(self.ask("TE?"), "0")
+
+
+class VirtualClockTest(unittest.TestCase):
+    def test_advance(self):
+        clock = VirtualClock()
+        self.assertEqual(clock(), 0.)
+        clock.advance(1.5)
+        clock.tick()
+        self.assertEqual(clock(), 1.5)
+
+    def test_step(self):
+        clock = VirtualClock(step=.01)
+        sim = NewFocus8742Sim(clock)
+        sim._writeline("1PR1000;1TP?")
+        self.assertAlmostEqual(clock(), .02)
+        sim.pending.clear()
+        for i in range(60):
+            sim._writeline("1MD?")
+        self.assertEqual(sim.pending.pop(), "1")
+        self.assertEqual(sim.pending.popleft(), "0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+
+from newfocus8742.simserver import SimServer
+from newfocus8742.test import AsyncTestCase
+
+
+class SimServerTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = SimServer()
+        self.port = self.run_async(self.server.start())
+
+    def tearDown(self):
+        self.server.close()
+        self.run_async(self.server.wait_closed())
+        super().tearDown()
+
+    def test_terminators(self):
+        async def run():
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", self.port)
+            try:
+                self.assertEqual(await reader.readexactly(6),
+                                 SimServer.banner)
+                # split across writes, CR, LF and CRLF terminated
+                for data in (b"1VA1001\r2VA", b"1002\n3VA1003\r\n",
+                             b"1VA?;2VA?\r3V", b"A?\n"):
+                    writer.write(data)
+                    await writer.drain()
+                    await asyncio.sleep(.01)
+                return [await asyncio.wait_for(reader.readline(), 1)
+                        for i in range(2)]
+            finally:
+                writer.close()
+
+        self.assertEqual(self.run_async(run()),
+                         [b"1001;1002\r\n", b"1003\r\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
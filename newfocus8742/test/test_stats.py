@@ -0,0 +1,26 @@
+import unittest
+
+from newfocus8742.stats import LinkStats
+
+
+class LinkStatsTest(unittest.TestCase):
+    def test_key(self):
+        stats = LinkStats()
+        self.assertEqual(stats.key("1TP?"), "TP?")
+        self.assertEqual(stats.key("1PR100;1MD?"), "PR;MD?")
+        self.assertEqual(stats.key(";".join(
+            "{}TP?".format(1 + i % 4) for i in range(12))), "TP?*12")
+        self.assertEqual(stats.key("1TP?;1MD?;2TP?;2MD?"), "TP?*2;MD?*2")
+
+    def test_sent(self):
+        stats = LinkStats()
+        stats.sent("1TP?;2TP?", depth=0)
+        stats.sent("3TP?", depth=1)
+        commands = stats.as_dict()["commands"]
+        self.assertEqual(commands["TP?*2"]["count"], 1)
+        self.assertEqual(commands["TP?*2"]["bytes_sent"], 9)
+        self.assertEqual(commands["TP?"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from newfocus8742.simserver import SimServer
+from newfocus8742.tcp import NewFocus8742TCP
+from newfocus8742.test import AsyncTestCase
+
+
+class _Server(SimServer):
+    """Keeps the server side of the connections to close them."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writers = []
+
+    async def _handle(self, reader, writer):
+        self.writers.append(writer)
+        await super()._handle(reader, writer)
+
+
+class TCPTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = _Server(latency=.01)
+        port = self.run_async(self.server.start())
+        self.dev = self.run_async(NewFocus8742TCP.connect("127.0.0.1", port))
+
+    def tearDown(self):
+        self.dev.close()
+        self.server.close()
+        self.run_async(self.server.wait_closed())
+        super().tearDown()
+
+    def test_reconnect_inflight(self):
+        self.dev.set_velocity(1, 1234)
+        self.dev.set_acceleration(2, 4321)
+        self.dev.adaptive_depth = False
+        # the pump sees the end of the stream before the reconnection starts
+        self.dev.timeout = None
+        self.dev.start_supervisor(10.)
+
+        async def run():
+            queries = [asyncio.ensure_future(q) for xx in range(1, 5)
+                       for q in (self.dev.get_velocity(xx),
+                                 self.dev.get_acceleration(xx))]
+            await asyncio.sleep(.015)
+            self.assertGreater(len(self.dev._inflight), 1)
+            self.server.writers.pop().close()
+            return await asyncio.gather(*queries)
+
+        ret = self.run_async(run())
+        self.assertEqual(len(self.server.writers), 1)
+        self.assertEqual(ret[0], 1234)
+        self.assertEqual(ret[3], 4321)
+        self.assertEqual(ret, [self.sim_get(cmd, xx) for xx in range(1, 5)
+                               for cmd in ("VA?", "AC?")])
+
+    def sim_get(self, cmd, xx):
+        self.server.sim._writeline(self.dev.fmt_cmd(cmd, xx))
+        return int(self.server.sim.pending.popleft())
+
+
+if __name__ == "__main__":
+    unittest.main()
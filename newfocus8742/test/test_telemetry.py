@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+from newfocus8742.sim import VirtualClock
+from newfocus8742.telemetry import TelemetryBuffer
+from newfocus8742.test import AsyncTestCase, LinkSim
+
+
+class TelemetryBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.buf = TelemetryBuffer(size=3, channels=2)
+
+    def append(self, t):
+        self.buf.append(t, [t, -t], [t % 2, 1], t*10)
+
+    def test_empty(self):
+        self.assertIsNone(self.buf.latest())
+        self.assertEqual(self.buf.history(), [])
+        self.assertEqual(len(self.buf), 0)
+
+    def test_wrap(self):
+        for t in range(1, 6):
+            self.append(t)
+            self.assertEqual(self.buf.latest(),
+                             (t, [t, -t], [t % 2, 1], t*10))
+        self.assertEqual(len(self.buf), 3)
+        self.assertEqual(self.buf.count, 5)
+        self.assertEqual([s[0] for s in self.buf.history()], [3, 4, 5])
+        self.assertEqual(self.buf.history()[0], (3, [3, -3], [1, 1], 30))
+
+    def test_since(self):
+        for t in range(1, 6):
+            self.append(t)
+        self.assertEqual([s[0] for s in self.buf.history(3.5)], [4, 5])
+        self.assertEqual([s[0] for s in self.buf.history(4)], [5])
+        self.assertEqual([s[0] for s in self.buf.history(0)], [3, 4, 5])
+        self.assertEqual(self.buf.history(5), [])
+
+
+class TelemetryTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dev = LinkSim(VirtualClock())
+
+    def tearDown(self):
+        self.dev.stop_telemetry()
+        super().tearDown()
+        self.dev.close()
+
+    def snapshot(self):
+        async def run():
+            self.dev.start_telemetry(interval=.001)
+            while not self.dev.history():
+                await asyncio.sleep(.001)
+            self.dev.stop_telemetry()
+        self.run_async(run())
+        del self.dev.lines[:]
+
+    def test_history(self):
+        self.assertEqual(self.dev.history(), [])
+        self.snapshot()
+        (t, position, done, error), = self.dev.history()
+        self.assertEqual((position, done, error), ([0]*4, [1]*4, 0))
+        self.assertEqual(self.dev.history(t), [])
+
+    def test_max_age(self):
+        self.snapshot()
+        # the snapshot does not see changes behind the driver's back
+        self.dev._axes[0].set(self.dev.clock(), 123)
+        self.assertEqual(self.run_async(
+            self.dev.position(1, max_age=10.)), 0)
+        self.assertEqual(self.dev.lines, [])
+        self.assertEqual(self.run_async(
+            self.dev.position(1, max_age=0.)), 123)
+        self.assertEqual(self.dev.lines, ["1TP?"])
+
+    def test_command_after_snapshot(self):
+        self.snapshot()
+        self.dev.set_home(1, 5)
+        self.assertEqual(self.run_async(
+            self.dev.position(1, max_age=10.)), 5)
+        self.assertEqual(self.run_async(self.dev.done(1, max_age=10.)), 1)
+        self.assertEqual(self.dev.lines, ["1DH5", "1TP?", "1MD?"])
+
+
+if __name__ == "__main__":
+    unittest.main()
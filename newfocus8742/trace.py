@@ -0,0 +1,145 @@
+import struct
+import time
+
+
+# record header: time stamp, direction, data length
+header = struct.Struct("<dcH")
+
+# directions
+WRITE = b">"
+READ = b"<"
+# not traffic: a ``name=value`` setting of the recording driver
+SETTING = b"="
+
+# trace file signature, followed by the records
+magic = b"NF8742T1"
+
+
+class FlightRecorder:
+    """Fixed size ring buffer of the recent wire traffic.
+
+    Each record holds a `time.monotonic()` time stamp, the direction
+    (:data:`WRITE` or :data:`READ`) and the raw bytes. The records are
+    packed into one preallocated `bytearray` of fixed width slots. Data
+    that does not fit into a slot is truncated (the original length is
+    kept).
+
+    Args:
+        size (int): Number of records kept.
+        width (int): Bytes per record including the header.
+    """
+    def __init__(self, size=256, width=128):
+        assert width > header.size
+        self.size = size
+        self.width = width
+        self._data = bytearray(size*width)
+        # total number of records
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def record(self, direction, data):
+        """Add a record, replacing the oldest one if full.
+
+        Args:
+            direction (bytes): :data:`WRITE` or :data:`READ`.
+            data (bytes): Raw data.
+        """
+        i = (self.count % self.size)*self.width
+        n = min(len(data), self.width - header.size)
+        header.pack_into(self._data, i, time.monotonic(), direction,
+                         len(data))
+        i += header.size
+        self._data[i:i + n] = data[:n]
+        self.count += 1
+
+    def records(self):
+        """Return the records, oldest first.
+
+        Returns:
+            list: ``(t, direction, data)`` tuples.
+        """
+        ret = []
+        for n in range(self.count - len(self), self.count):
+            i = (n % self.size)*self.width
+            t, direction, length = header.unpack_from(self._data, i)
+            i += header.size
+            length = min(length, self.width - header.size)
+            ret.append((t, direction, bytes(self._data[i:i + length])))
+        return ret
+
+    def save(self, f):
+        """Write the records to a trace file (see :class:`TraceWriter`).
+
+        Args:
+            f (file): Binary file opened for writing.
+        """
+        records = self.records()
+        writer = TraceWriter(f, records[0][0] if records else None)
+        for t, direction, data in records:
+            writer.write(direction, data, t)
+
+    def format(self):
+        """Return the records as text, one line per record, oldest
+        first."""
+        return "\n".join("{:.6f} {} {!r}".format(t, direction.decode(), data)
+                         for t, direction, data in self.records())
+
+
+class TraceWriter:
+    """Write a trace file.
+
+    The file starts with :data:`magic`, followed by the records, each a
+    :data:`header` (time since the start in seconds, direction and data
+    length) and the data. Records with the direction :data:`SETTING`
+    hold ``name=value`` settings of the driver instead of traffic.
+
+    Args:
+        f (file): Binary file opened for writing.
+        t0 (float): `time.monotonic()` of the start. Now if None.
+    """
+    def __init__(self, f, t0=None):
+        if t0 is None:
+            t0 = time.monotonic()
+        self.f = f
+        self.t0 = t0
+        f.write(magic)
+
+    def write(self, direction, data, t=None):
+        """Add a record.
+
+        Args:
+            direction (bytes): :data:`WRITE` or :data:`READ`.
+            data (bytes): Raw data.
+            t (float): `time.monotonic()` time stamp. Now if None.
+        """
+        if t is None:
+            t = time.monotonic()
+        self.f.write(header.pack(t - self.t0, direction, len(data)))
+        self.f.write(data)
+
+
+def read_trace(f):
+    """Read a trace file written by :class:`TraceWriter`.
+
+    Args:
+        f (file): Binary file opened for reading.
+
+    Yields:
+        tuple: ``(t, direction, data)`` with the time since the start of
+        the trace.
+    """
+    if f.read(len(magic)) != magic:
+        raise ValueError("not a trace file")
+    while True:
+        h = f.read(header.size)
+        if not h:
+            break
+        if len(h) < header.size:
+            raise ValueError("truncated trace file")
+        t, direction, length = header.unpack(h)
+        data = f.read(length)
+        if len(data) < length:
+            raise ValueError("truncated trace file")
+        yield t, direction, data
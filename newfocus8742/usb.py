@@ -1,14 +1,30 @@
+import array
+import asyncio
+import errno
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 import usb.core
 import usb.util
 
 from .protocol import NewFocus8742Protocol
+from .linebuffer import LineBuffer
+from .trace import WRITE, READ
+
+logger = logging.getLogger(__name__)
 
 
 class NewFocus8742USB(NewFocus8742Protocol):
     eol_write = b"\r"
     eol_read = b"\r\n"
+    timeout = 1.
+    # Bytes per IN transfer. Transfers only end early on short packets:
+    # only increase beyond one packet if the device terminates responses
+    # with a short (or zero length) packet.
+    read_size = 64
 
     def __init__(self, dev):
+        super().__init__()
         self.dev = dev
         # dev.set_configuration()  # breaks the second invocation
         cfg = dev.get_active_configuration()
@@ -26,6 +42,14 @@ class NewFocus8742USB(NewFocus8742Protocol):
         assert self.ep_in is not None
         assert self.ep_in.wMaxPacketSize == 64
         self.flush()
+        # pyusb/libusb calls block: do them on one thread per endpoint
+        # (keeping the transfers of each endpoint in order) and leave
+        # the event loop free
+        self._tx = ThreadPoolExecutor(max_workers=1)
+        self._rx = ThreadPoolExecutor(max_workers=1)
+        self._read_fut = None
+        self._packet = array.array("B", bytes(self.read_size))
+        self._lines = LineBuffer(self.eol_read)
 
     @classmethod
     async def connect(cls, idVendor=0x104d, idProduct=0x4000, **kwargs):
@@ -52,6 +76,8 @@ class NewFocus8742USB(NewFocus8742Protocol):
                 break
 
     def close(self):
+        self._tx.shutdown()
+        self._rx.shutdown()
         usb.util.dispose_resources(self.dev)
 
     def __enter__(self):
@@ -61,11 +87,50 @@ class NewFocus8742USB(NewFocus8742Protocol):
         self.close()
 
     def _writeline(self, cmd):
-        self.ep_out.write(cmd.encode() + self.eol_write)
+        data = cmd.encode() + self.eol_write
+        self._recorder.record(WRITE, data)
+        fut = asyncio.get_event_loop().run_in_executor(
+            self._tx, self.ep_out.write, data, int(self.timeout*1e3))
+        fut.add_done_callback(self._write_done)
+
+    def _write_done(self, fut):
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.error("write failed", exc_info=fut.exception())
+
+    def _read(self):
+        try:
+            return self.ep_in.read(self._packet, int(self.timeout*1e3))
+        except usb.core.USBError as e:
+            if e.errno == errno.ETIMEDOUT:
+                raise asyncio.TimeoutError() from e
+            raise
+
+    def _read_done(self, fut):
+        # Runs before any waiter resumes, also when the waiter has been
+        # cancelled in the meantime. Data read is never lost.
+        self._read_fut = None
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        data = memoryview(self._packet)[:fut.result()]
+        self._recorder.record(READ, data)
+        try:
+            self._lines.feed(data)
+        except BufferError:
+            # the responses are lost, resync() realigns them
+            self._dump_trace("line buffer overflow")
+            self._lines.clear()
+
+    def _resync(self):
+        self._lines.clear()
+        return super()._resync()
 
     async def _readline(self):
-        # This is obviously not asynchronous
-        r = self.ep_in.read(64).tobytes()
-        assert r.endswith(self.eol_read)
-        r = r[:-2].decode()
-        return r
+        while True:
+            r = self._lines.readline()
+            if r is not None:
+                return r
+            if self._read_fut is None:
+                self._read_fut = asyncio.get_event_loop().run_in_executor(
+                    self._rx, self._read)
+                self._read_fut.add_done_callback(self._read_done)
+            await asyncio.shield(self._read_fut)
@@ -19,6 +19,9 @@ setup(
     entry_points={
         "console_scripts": [
             "aqctl_newfocus8742 = newfocus8742.aqctl_newfocus8742:main",
+            "newfocus8742_sim = newfocus8742.simserver:main",
+            "newfocus8742_farm = newfocus8742.farm:main",
+            "newfocus8742_bench = newfocus8742.bench:main",
         ],
     },
     test_suite="newfocus8742.test",
@@ -1,7 +1,6 @@
 import time
 import logging
 import asyncio
-import timeit
 
 from newfocus8742.usb import NewFocus8742USB as USB
 from newfocus8742.tcp import NewFocus8742TCP as TCP
@@ -33,22 +32,15 @@ def main():
             print(await dev.get_relative(1))
             dev.set_relative(1, 10)
             await dev.finish(1)
-            async def k():
-                for i in range(100):
-                    await dev.error_code()
-            import __main__
-            __main__.k = k
-            __main__.loop = loop
-            __main__.dev = dev
     loop.run_until_complete(run())
-    print(timeit.timeit("loop.run_until_complete(k())",
-        "from __main__ import k, loop", number=1)/100/1)
+    # for timing, see newfocus8742_bench --help
 
 
 async def dump(dev):
-    for i in range(4):
-        for cmd in "AC DH MD PA PR QM TP VA".split():
-            print(1 + i, cmd, await dev.ask(cmd + "?", 1 + i))
+    cmds = [(cmd + "?", 1 + i)
+            for i in range(4) for cmd in "AC DH MD PA PR QM TP VA".split()]
+    for (cmd, xx), ret in zip(cmds, await dev.ask_many(cmds)):
+        print(xx, cmd, ret)
     for cmd in ("SA SC SD TB TE VE ZZ "
                 "GATEWAY HOSTNAME IPADDR IPMODE MACADDR NETMASK "
                 ).split():